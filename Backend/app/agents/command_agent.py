@@ -1,32 +1,51 @@
+import re
 import shlex
+from collections import deque
 from typing import Callable
 import gitlab
 from pymongo.database import Database
 
 from pydantic_ai import Agent
 from pydantic_ai.messages import ModelMessage
-from pydantic_ai.models.openai import OpenAIChatModel, OpenAIChatModelSettings
-from pydantic_ai.providers.openrouter import OpenRouterProvider
-
-from .commands import (
-    CommandInterface,
-    HelpCommand,
-    ReviewCommand,
-    SuggestCommand,
-    DescribeCommand,
-    AddDocsCommand,
-    CommandParseError,
-)
+from pydantic_ai.models.openai import OpenAIChatModelSettings
+
+from . import commands as commands_package
+from .commands import CommandParseError
+from app.agents.utils import build_openrouter_model
 from app.db.models import Bot, MrAgentHistory
 
+# One whole shell-like token: a quoted string or a bare word, followed by
+# whitespace or the end of the text. Anything fancier goes through shlex.
+_TOKEN_RE = re.compile(
+    r"""[ \t\r\n]*(?:"([^"\\]*)"|'([^']*)'|([^ \t\r\n"'\\]+))(?=[ \t\r\n]|\Z)"""
+)
+
+
+def _split_command(text: str) -> list[str]:
+    """Split a command like ``shlex.split`` with a regex fast path for simple input."""
+    tokens: list[str] = []
+    pos = 0
+    end = len(text.rstrip(" \t\r\n"))
+    while pos < end:
+        match = _TOKEN_RE.match(text, pos)
+        if match is None:
+            # Escapes, unbalanced or glued quotes: let shlex handle (or reject) it
+            return shlex.split(text)
+        # Exactly one of the alternatives participated in the match
+        tokens.append(match.group(match.lastindex))
+        pos = match.end()
+    return tokens
+
 
 class CommandAgent:
-    commands: dict[str, CommandInterface] = {
-        "help": HelpCommand,
-        "review": ReviewCommand,
-        "describe": DescribeCommand,
-        "suggest": SuggestCommand,
-        "add_docs": AddDocsCommand,
+    # Command name -> class name in `app.agents.commands`. Classes are resolved
+    # on dispatch so only the invoked command's module gets imported.
+    commands: dict[str, str] = {
+        "help": "HelpCommand",
+        "review": "ReviewCommand",
+        "describe": "DescribeCommand",
+        "suggest": "SuggestCommand",
+        "add_docs": "AddDocsCommand",
     }
 
     def __init__(
@@ -52,10 +71,8 @@ class CommandAgent:
             max_tokens=max_tokens,
             extra_body=extra_body,
         )
-        self.model = OpenAIChatModel(
-            model_name=model_name,
-            settings=self.model_settings,
-            provider=OpenRouterProvider(api_key=openrouter_api_key),
+        self.model = build_openrouter_model(
+            model_name, self.model_settings, openrouter_api_key
         )
         self.gitlab_client = gitlab_client
         self.mongo_db = mongo_db
@@ -73,7 +90,7 @@ class CommandAgent:
         if command_name not in self.commands:
             raise CommandParseError(f"Unknown command: {command_name}")
 
-        command_class = self.commands[command_name]
+        command_class = getattr(commands_package, self.commands[command_name])
         command_instance = command_class(
             gitlab_client=self.gitlab_client,
             mongo_db=self.mongo_db,
@@ -111,7 +128,7 @@ class CommandAgent:
         """
         # Tokenize safely
         try:
-            tokens = shlex.split(text)
+            tokens = _split_command(text)
         except Exception as exc:
             raise CommandParseError(f"Failed to parse command: {exc}")
 
@@ -122,28 +139,26 @@ class CommandAgent:
 
         flags = {}
         args = []
-        it = iter(tokens[1:])
+        remaining = deque(tokens[1:])
 
-        for token in it:
+        while remaining:
+            token = remaining.popleft()
             if token.startswith("--"):
                 key = token[2:]
                 if not key:
                     raise CommandParseError("Empty flag name '--' detected.")
 
                 # Check next token for value
-                try:
-                    nxt = next(it)
-                except StopIteration:
+                if not remaining:
                     # Flag without value → interpreted as True
                     flags[key] = True
                     continue
 
-                if nxt.startswith("--"):
-                    # No value → True, but push nxt back into iterator
+                if remaining[0].startswith("--"):
+                    # No value → True, leave the next flag in place
                     flags[key] = True
-                    it = iter([nxt] + list(it))
                 else:
-                    flags[key] = nxt
+                    flags[key] = remaining.popleft()
             else:
                 args.append(token)
 
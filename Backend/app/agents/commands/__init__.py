@@ -1,31 +1,79 @@
-from .add_docs import AddDocsCommand, AddDocsDocumentation, AddDocsInput, AddDocsOutput
-from .command_interface import CommandInterface
-from .help import HelpCommand
-from .describe import DescribeCommand, DescribeInput, FileDescription, MRType
-from .review import (
-    IssueCompliance,
-    KeyIssuesComponentLink,
-    ReviewCommand,
-    ReviewInput,
-)
-from .suggest import (
-    CodeSuggestion,
-    CodeSuggestionFeedback,
-    MRCodeSuggestionsFeedbackOutput,
-    MRCodeSuggestionsOutput,
-    SuggestCommand,
-    SuggestFeedbackCommand,
-    SuggestFeedbackInput,
-    SuggestInput,
-)
+import importlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .add_docs import (
+        AddDocsCommand,
+        AddDocsDocumentation,
+        AddDocsInput,
+        AddDocsOutput,
+    )
+    from .command_interface import CommandInterface
+    from .help import HelpCommand
+    from .describe import DescribeCommand, DescribeInput, FileDescription, MRType
+    from .review import (
+        IssueCompliance,
+        KeyIssuesComponentLink,
+        ReviewCommand,
+        ReviewInput,
+    )
+    from .suggest import (
+        CodeSuggestion,
+        CodeSuggestionFeedback,
+        MRCodeSuggestionsFeedbackOutput,
+        MRCodeSuggestionsOutput,
+        SuggestCommand,
+        SuggestFeedbackCommand,
+        SuggestFeedbackInput,
+        SuggestInput,
+    )
 
 
 class CommandParseError(Exception):
     pass
 
 
+# Command modules build their prompt templates and output models at import
+# time, so they are only imported when one of their names is first used.
+_LAZY_IMPORTS: dict[str, str] = {
+    "CommandInterface": ".command_interface",
+    "HelpCommand": ".help",
+    "AddDocsCommand": ".add_docs",
+    "AddDocsDocumentation": ".add_docs",
+    "AddDocsInput": ".add_docs",
+    "AddDocsOutput": ".add_docs",
+    "MRType": ".describe",
+    "DescribeCommand": ".describe",
+    "DescribeInput": ".describe",
+    "FileDescription": ".describe",
+    "ReviewCommand": ".review",
+    "ReviewInput": ".review",
+    "IssueCompliance": ".review",
+    "KeyIssuesComponentLink": ".review",
+    "CodeSuggestion": ".suggest",
+    "CodeSuggestionFeedback": ".suggest",
+    "MRCodeSuggestionsOutput": ".suggest",
+    "MRCodeSuggestionsFeedbackOutput": ".suggest",
+    "SuggestCommand": ".suggest",
+    "SuggestFeedbackCommand": ".suggest",
+    "SuggestFeedbackInput": ".suggest",
+    "SuggestInput": ".suggest",
+}
+
+
+def __getattr__(name: str):
+    module_name = _LAZY_IMPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
 __all__ = [
     "CommandInterface",
+    "CommandParseError",
     "HelpCommand",
     "AddDocsCommand",
     "AddDocsDocumentation",
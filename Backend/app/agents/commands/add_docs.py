@@ -28,6 +28,8 @@ class AddDocsOutput(BaseModel):
 
 
 class AddDocsCommand(CommandInterface):
+    __slots__ = ()
+
     async def run(
         self,
         project_id: int,
@@ -37,8 +39,10 @@ class AddDocsCommand(CommandInterface):
     ) -> str:
         pass
 
-    def _render_input(self, input_data: AddDocsInput) -> str:
-        return user_template.render(**input_data.model_dump())
-
-    def _render_system_prompt(self, input_data: AddDocsInput) -> str:
-        return system_template.render(**input_data.model_dump())
+    def _render_prompts(self, input_data: AddDocsInput) -> tuple[str, str]:
+        """Render the (system, user) prompts from the input fields."""
+        template_vars = input_data.__dict__
+        return (
+            system_template.render(**template_vars),
+            user_template.render(**template_vars),
+        )
@@ -1,17 +1,24 @@
 from abc import ABC, abstractmethod
 from typing import Optional, List
+import asyncio
+import hashlib
 import re
 import gitlab
+from cachetools import LRUCache, TTLCache
 from pymongo.database import Database
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 from pydantic_ai import Agent
 from pydantic_ai.models.openai import OpenAIChatModel
 
 from app.db.models import Bot
 from app.core.config import settings
 from app.core.log import logger
-from app.agents.utils import token_counter
+from app.agents.utils import model_cache_key, token_counter
+from app.services.cache_service import CacheService
+
+_HUNK_RE = re.compile(r"@@\s+-([0-9]+)(?:,[0-9]+)?\s+\+([0-9]+)")
+_ISSUE_RE = re.compile(r"(?<!\w)#(\d+)")
 
 
 class RelatedIssue(BaseModel):
@@ -21,7 +28,25 @@ class RelatedIssue(BaseModel):
     description: Optional[str] = None
 
 
+# Issues rarely change between webhook deliveries, so share the fetched ones
+# across command runs for a few minutes. Keyed by (project_id, issue_iid).
+_issue_cache: TTLCache = TTLCache(maxsize=2048, ttl=300)
+
+# Agents only depend on the system prompt and output type; the bot's model is
+# passed on each run, so one agent serves every bot and webhook delivery.
+_agent_cache: LRUCache = LRUCache(maxsize=64)
+
+
 class CommandInterface(ABC):
+    # A command object is created for every bot command; skip the per-instance
+    # __dict__. Subclasses declare an empty __slots__ to keep it that way.
+    __slots__ = (
+        "gitlab_client",
+        "mongo_db",
+        "bot",
+        "model",
+    )
+
     def __init__(
         self,
         gitlab_client: gitlab.Gitlab,
@@ -52,12 +77,54 @@ class CommandInterface(ABC):
         self,
         system_prompt: str,
         output_type: BaseModel,
-    ) -> None:
-        self.agent = Agent(
-            model=self.model,
-            system_prompt=system_prompt,
-            output_type=output_type,
+    ) -> Agent:
+        cache_key = (system_prompt, output_type)
+        agent = _agent_cache.get(cache_key)
+        if agent is None:
+            agent = Agent(system_prompt=system_prompt, output_type=output_type)
+            _agent_cache[cache_key] = agent
+        return agent
+
+    async def run_cached(
+        self,
+        agent: Agent,
+        system_prompt: str,
+        output_type: type[BaseModel],
+        user_prompt: str,
+        use_cache: bool = True,
+    ) -> BaseModel:
+        """
+        Run `agent` (built by `build_agent` from `system_prompt` and
+        `output_type`), reusing the stored output when the same model, with the
+        same settings, already answered the same system and user prompts
+        recently. With `use_cache=False` the agent always runs and its output
+        replaces the stored one.
+        """
+        digest = hashlib.blake2b(
+            f"{model_cache_key(self.model.model_name, self.model.settings)}|"
+            f"{system_prompt}|{user_prompt}".encode(),
+            digest_size=16,
+        ).hexdigest()
+        cache_key = f"llm_output:{digest}"
+        cache_service = CacheService(self.mongo_db)
+
+        cached_output = (
+            await asyncio.to_thread(cache_service.get, cache_key) if use_cache else None
+        )
+        if cached_output is not None:
+            try:
+                return output_type.model_validate_json(cached_output)
+            except ValidationError as exc:
+                logger.warning("Ignoring stale cached LLM output: %s", str(exc))
+
+        response = await agent.run(user_prompt=user_prompt, model=self.model)
+        await asyncio.to_thread(
+            cache_service.set,
+            cache_key,
+            response.output.model_dump_json(),
+            ttl_seconds=settings.llm_output_cache_ttl_seconds,
         )
+        return response.output
 
     async def gether_gitlab_data(
         self, project_id: int, mr_iid: int
@@ -69,11 +136,12 @@ class CommandInterface(ABC):
             "diff": "",
             "description": None,
             "related_issues": [],
+            "project_path": "",
         }
 
         try:
             project = self.gitlab_client.projects.get(project_id, lazy=True)
-            mr = project.mergerequests.get(mr_iid)
+            mr = await asyncio.to_thread(project.mergerequests.get, mr_iid)
         except gitlab.GitlabError as exc:
             logger.error(
                 "Failed to fetch MR %s in project %s: %s", mr_iid, project_id, str(exc)
@@ -83,59 +151,106 @@ class CommandInterface(ABC):
         data["title"] = mr.title
         data["branch"] = mr.source_branch
         data["description"] = mr.description
+        # references["full"] is "<project path>!<iid>", so the project path
+        # comes for free without fetching the project itself
+        references = getattr(mr, "references", None) or {}
+        data["project_path"] = references.get("full", "").rpartition("!")[0]
 
-        try:
-            data["diff"] = self._gether_gitlab_diff(mr)
-        except Exception as exc:  # pragma: no cover - defensive
+        # The diff and the referenced issues only depend on the MR, so fetch
+        # them concurrently
+        issue_ids = self._extract_issue_iids(mr.title, mr.description)
+        diff, related_issues = await asyncio.gather(
+            asyncio.to_thread(self._gether_gitlab_diff, mr),
+            self._gether_related_issues(project, project_id, issue_ids),
+            return_exceptions=True,
+        )
+
+        if isinstance(diff, Exception):  # pragma: no cover - defensive
             logger.error(
                 "Failed to build diff for MR %s in project %s: %s",
                 mr_iid,
                 project_id,
-                str(exc),
+                str(diff),
             )
+        else:
+            data["diff"] = diff
 
-        issue_ids = self._extract_issue_iids(mr.title, mr.description)
-        related_issues: list[RelatedIssue] = []
+        if isinstance(related_issues, Exception):  # pragma: no cover - defensive
+            logger.error(
+                "Failed to fetch related issues for MR %s in project %s: %s",
+                mr_iid,
+                project_id,
+                str(related_issues),
+            )
+        else:
+            data["related_issues"] = related_issues
+
+        return data
 
+    async def _gether_related_issues(
+        self,
+        project: "gitlab.v4.objects.Project",
+        project_id: int,
+        issue_ids: list[int],
+    ) -> list[RelatedIssue]:
+        """Fetch the referenced issues in one request, skipping unknown ones."""
+        issues: dict[int, RelatedIssue] = {}
+        missing_ids: list[int] = []
         for issue_iid in issue_ids:
-            try:
-                issue = project.issues.get(issue_iid)
-                related_issues.append(
-                    RelatedIssue(
-                        id=f"#{issue_iid}",
-                        title=issue.title or "",
-                        labels=issue.labels or [],
-                        description=issue.description or "",
-                    )
-                )
-            except gitlab.GitlabError as exc:
-                logger.error(
-                    "Failed to fetch issue #%s in project %s: %s",
-                    issue_iid,
-                    project_id,
-                    str(exc),
-                )
-            except Exception as exc:  # pragma: no cover - defensive
+            cached_issue = _issue_cache.get((project_id, issue_iid))
+            if cached_issue is None:
+                missing_ids.append(issue_iid)
+            else:
+                issues[issue_iid] = cached_issue
+
+        if not missing_ids:
+            return [issues[issue_iid] for issue_iid in issue_ids]
+
+        # The issues endpoint filters by several iids at once, so a single
+        # round-trip covers every issue the MR mentions
+        try:
+            fetched = await asyncio.to_thread(
+                project.issues.list, iids=missing_ids, get_all=True
+            )
+        except gitlab.GitlabError as exc:
+            logger.error(
+                "Failed to fetch issues %s in project %s: %s",
+                missing_ids,
+                project_id,
+                str(exc),
+            )
+            fetched = []
+
+        for issue in fetched:
+            # GitLab already returns these as strings and a list of strings
+            related_issue = RelatedIssue.model_construct(
+                id=f"#{issue.iid}",
+                title=issue.title or "",
+                labels=issue.labels or [],
+                description=issue.description or "",
+            )
+            issues[issue.iid] = related_issue
+            _issue_cache[(project_id, issue.iid)] = related_issue
+
+        for issue_iid in missing_ids:
+            if issue_iid not in issues:
                 logger.error(
-                    "Unexpected error fetching issue #%s in project %s: %s",
+                    "Failed to fetch issue #%s in project %s: not found",
                     issue_iid,
                     project_id,
-                    str(exc),
                 )
 
-        data["related_issues"] = related_issues
-
-        return data
+        return [issues[issue_iid] for issue_iid in issue_ids if issue_iid in issues]
 
     def _gether_gitlab_diff(self, mr: "gitlab.v4.objects.ProjectMergeRequest") -> str:
         """Gather context for the merge request including diffs, title, and description."""
         try:
-            diff_versions = mr.diffs.list(page=1, per_page=1)
-            latest_version = diff_versions[0] if diff_versions else None
-            if latest_version is None:
-                logger.warning("No diff versions found for MR %s", mr.iid)
+            # A single request returning the latest diff inline, instead of
+            # listing diff versions and then fetching the newest one
+            mr_diffs = mr.changes().get("changes", [])
+            if not mr_diffs:
+                logger.warning("No changes found for MR %s", mr.iid)
                 return ""
-            mr_diffs = mr.diffs.get(latest_version.id).diffs
         except Exception as exc:  # pragma: no cover - defensive
             logger.error(
                 "Failed to fetch diff for MR %s: %s",
@@ -150,11 +265,22 @@ class CommandInterface(ABC):
             "",
         ]
 
+        max_tokens = settings.max_tokens_per_diff
+        # No realistic tokenizer packs more than ~8 characters into a token, so
+        # anything longer than this is over budget without counting tokens.
+        max_chars = max_tokens * 8
+        # A token spans at least one UTF-8 byte and a character at most four,
+        # so anything this short is within budget without counting either.
+        safe_chars = max_tokens // 4
+
         ignored_files: list[str] = []
         for diff in mr_diffs:
             diff_text = diff.get("diff", "") or ""
             # Skip diffs that are too large (token-based)
-            if token_counter(diff_text) > settings.max_tokens_per_diff:
+            diff_chars = len(diff_text)
+            if diff_chars > max_chars or (
+                diff_chars > safe_chars and token_counter(diff_text) > max_tokens
+            ):
                 ignored_files.append(
                     diff.get("new_path", "") or diff.get("old_path", "unknown")
                 )
@@ -174,26 +300,25 @@ class CommandInterface(ABC):
             can_review = (
                 not getattr(diff, "too_large", False)
                 and not getattr(diff, "collapsed", False)
-                and bool(diff_text.strip())
+                # Same as bool(diff_text.strip()) without copying the diff
+                and bool(diff_text)
+                and not diff_text.isspace()
             )
 
+            # One entry per file block; the final join supplies the newlines
             context_lines.append(
-                f"## File: '{diff.get('new_path') or diff.get('old_path') or 'unknown'}'"
+                f"## File: '{diff.get('new_path') or diff.get('old_path') or 'unknown'}'\n"
+                f"old_path: {diff.get('old_path')}\n"
+                f"new_path: {diff.get('new_path')}\n"
+                f"status: {status}\n"
+                f"can_review_diff: {str(can_review).lower()}\n"
             )
-            context_lines.append(f"old_path: {diff.get('old_path')}")
-            context_lines.append(f"new_path: {diff.get('new_path')}")
-            context_lines.append(f"status: {status}")
-            context_lines.append(f"can_review_diff: {str(can_review).lower()}")
-            context_lines.append("")
 
             if can_review:
                 formatted_diff = self._format_diff_with_line_numbers(diff_text)
-                context_lines.append("Diff:")
-                context_lines.append(formatted_diff)
+                context_lines.append(f"Diff:\n{formatted_diff}\n")
             else:
-                context_lines.append("Diff unavailable")
-
-            context_lines.append("")
+                context_lines.append("Diff unavailable\n")
 
         if ignored_files:
             context_lines.append(
@@ -206,58 +331,54 @@ class CommandInterface(ABC):
     @staticmethod
     def _format_diff_with_line_numbers(diff_text: str) -> str:
         """Add line numbers to added/removed lines based on hunk headers."""
-
-        def _format_prefix(line_no: int | None) -> str:
-            return f"{line_no}".rjust(6) if line_no is not None else " " * 6
-
-        formatted_lines: list[str] = []
-        old_line_no: int | None = None
-        new_line_no: int | None = None
-
-        for line in diff_text.splitlines():
-            if line.startswith("@@"):
-                match = re.search(r"@@\s+-([0-9]+)(?:,[0-9]+)?\s+\+([0-9]+)", line)
-                if match:
-                    old_line_no = int(match.group(1))
-                    new_line_no = int(match.group(2))
-                formatted_lines.append(line)
-                continue
-
-            if line.startswith("+") and not line.startswith("+++"):
-                formatted_lines.append(f"{_format_prefix(new_line_no)} {line}")
-                if new_line_no is not None:
-                    new_line_no += 1
-                continue
-
-            if line.startswith("-") and not line.startswith("---"):
-                formatted_lines.append(f"{_format_prefix(old_line_no)} {line}")
-                if old_line_no is not None:
-                    old_line_no += 1
-                continue
-
-            if line.startswith(" ") or line.startswith("\t"):
-                if old_line_no is not None:
-                    old_line_no += 1
-                if new_line_no is not None:
-                    new_line_no += 1
-                formatted_lines.append(line)
-                continue
-
-            formatted_lines.append(line)
-
-        return "\n".join(formatted_lines)
+        hunk_search = _HUNK_RE.search
+        blank_prefix = " " * 6
+
+        def _gen():
+            old_line_no: int | None = None
+            new_line_no: int | None = None
+
+            for line in diff_text.splitlines():
+                # Most lines are context, then additions and removals; test in
+                # that order so the common case costs a single startswith()
+                if line.startswith((" ", "\t")):
+                    if old_line_no is not None:
+                        old_line_no += 1
+                    if new_line_no is not None:
+                        new_line_no += 1
+                    yield line
+                elif line.startswith("+") and not line.startswith("+++"):
+                    if new_line_no is None:
+                        yield f"{blank_prefix} {line}"
+                    else:
+                        yield f"{new_line_no:>6} {line}"
+                        new_line_no += 1
+                elif line.startswith("-") and not line.startswith("---"):
+                    if old_line_no is None:
+                        yield f"{blank_prefix} {line}"
+                    else:
+                        yield f"{old_line_no:>6} {line}"
+                        old_line_no += 1
+                elif line.startswith("@@"):
+                    match = hunk_search(line)
+                    if match:
+                        old_line_no = int(match.group(1))
+                        new_line_no = int(match.group(2))
+                    yield line
+                else:
+                    yield line
+
+        return "\n".join(_gen())
 
     @staticmethod
     def _extract_issue_iids(title: str | None, description: str | None) -> list[int]:
         """Return unique issue IIDs mentioned as #<number> in the title or description."""
-        combined_text = f"{title or ''}\n{description or ''}"
-        issue_ids: list[int] = []
-        seen: set[int] = set()
-
-        for match in re.findall(r"(?<!\w)#(\d+)", combined_text):
-            issue_iid = int(match)
-            if issue_iid not in seen:
-                seen.add(issue_iid)
-                issue_ids.append(issue_iid)
+        # dict keeps first-seen order and deduplicates in one step
+        issue_ids: dict[int, None] = {}
+        for text in (title, description):
+            if not text:
+                continue
+            for match in _ISSUE_RE.finditer(text):
+                issue_ids.setdefault(int(match.group(1)), None)
 
-        return issue_ids
+        return list(issue_ids)
@@ -1,14 +1,20 @@
 from enum import Enum
-from typing import List, Optional
+from functools import lru_cache
+from typing import NotRequired, TypedDict
 
 from pydantic import BaseModel, create_model
-from pydantic_ai import AgentRunResult
 
 from .command_interface import CommandInterface, RelatedIssue
 from app.agents.utils import get_line_link
 from app.prompts.describe import system_template, user_template
 from app.core.config import settings
 
+# Rendered on every run; bind it once
+_render_user_prompt = user_template.render
+
+# Single quotes would break out of the file table's attribute values
+_FNAME_TRANS = str.maketrans({"'": "`"})
+
 
 class MRType(str, Enum):
     bug_fix = "Bug fix"
@@ -22,24 +28,28 @@ class DescribeInput(BaseModel):
     title: str
     branch: str
     diff: str
-    description: Optional[str] = None
-    commit_messages_str: Optional[str] = None
-    related_issues: Optional[List[RelatedIssue]] = None
-    extra_instructions: Optional[str] = None
+    description: str | None = None
+    commit_messages_str: str | None = None
+    related_issues: list[RelatedIssue] | None = None
+    extra_instructions: str | None = None
     enable_diagram: bool = False
     enable_files: bool = False
     enable_file_summary: bool = False
     duplicate_prompt_examples: bool = False
 
 
-class FileDescription(BaseModel):
+# Leaf output entries are TypedDicts: pydantic still validates them, but they
+# come back as the plain dicts _convert_to_markdown reads anyway.
+class FileDescription(TypedDict):
     filename: str
-    changes_summary: Optional[str] = None
+    changes_summary: NotRequired[str | None]
     changes_title: str
     label: str
 
 
 class DescribeCommand(CommandInterface):
+    __slots__ = ()
+
     async def run(
         self,
         project_id: int,
@@ -65,31 +75,24 @@ class DescribeCommand(CommandInterface):
         )
 
         # Render prompts
-        system_prompt = self._render_system_prompt(input_data)
-        user_prompt = self._render_input(input_data)
+        system_prompt, user_prompt = self._render_prompts(input_data)
 
         # Build MR describe output base model dynamically
-        model_fields = {
-            "type": (List[MRType], ...),
-            "description": (str, ...),
-            "title": (str, ...),
-            "changes_diagram": (Optional[str], None)
-            if input_data.enable_diagram
-            else None,
-            "mr_files": (Optional[List[FileDescription]], None)
-            if input_data.enable_files
-            else None,
-        }
-        # Remove None fields
-        model_fields = {k: v for k, v in model_fields.items() if v is not None}
-        MRDescriptionOutput = create_model("MRDescriptionOutput", **model_fields)
+        MRDescriptionOutput = _build_describe_model(
+            input_data.enable_diagram, input_data.enable_files
+        )
 
         # Build agent
-        self.build_agent(system_prompt, MRDescriptionOutput)
+        agent = self.build_agent(system_prompt, MRDescriptionOutput)
 
         # Get response from agent
-        response: AgentRunResult = await self.agent.run(user_prompt=user_prompt)
-        output_data = response.output
+        output_data = await self.run_cached(
+            agent,
+            system_prompt,
+            MRDescriptionOutput,
+            user_prompt,
+            use_cache=not flags.get("no_cache", False),
+        )
 
         # Convert to markdown
         markdown_text = self._convert_to_markdown(output_data)
@@ -99,14 +102,14 @@ class DescribeCommand(CommandInterface):
     def _convert_to_markdown(
         self,
         output_data: BaseModel,
-        project_id: Optional[int] = None,
+        project_id: int | None = None,
         source_branch: str | None = None,
     ) -> str:
         """Render the model output into the legacy markdown layout."""
 
         def _normalize_dict(data: BaseModel | dict) -> dict:
-            if isinstance(data, BaseModel):
-                return data.model_dump()
+            # A model iterates over its fields without dumping them; the nested
+            # file entries are TypedDicts, so they already are plain dicts
             return dict(data)
 
         def _format_diagram(diagram: str) -> str:
@@ -140,8 +143,8 @@ class DescribeCommand(CommandInterface):
                     f"<tr><td><strong>{label.capitalize()}</strong></td><td><table>"
                 )
                 for file in label_files:
-                    filename = (file.get("filename") or "").replace("'", "`")
-                    display_name = filename.split("/")[-1] if filename else ""
+                    filename = (file.get("filename") or "").translate(_FNAME_TRANS)
+                    display_name = filename.rpartition("/")[2]
                     changes_title = (file.get("changes_title") or "").strip()
                     changes_summary = (file.get("changes_summary") or "").strip()
 
@@ -158,17 +161,19 @@ class DescribeCommand(CommandInterface):
                         except Exception:
                             link = ""
 
-                    heading = (
+                    name_html = (
                         f'<a href="{link}"><strong>{display_name}</strong></a>'
                         if link
                         else f"<strong>{display_name}</strong>"
                     )
-                    if changes_title:
-                        heading += f"<dd><code>{changes_title}</code></dd>"
-
+                    title_html = (
+                        f"<dd><code>{changes_title}</code></dd>"
+                        if changes_title
+                        else ""
+                    )
                     summary_html = changes_summary.replace("\\n", "<br>")
                     html_parts.append(
-                        f"<tr><td>{heading}</td><td>{summary_html}</td></tr>"
+                        f"<tr><td>{name_html}{title_html}</td><td>{summary_html}</td></tr>"
                     )
 
                 html_parts.append("</table></td></tr>")
@@ -180,17 +185,10 @@ class DescribeCommand(CommandInterface):
         title = (data.get("title") or "").strip()
         description = (data.get("description") or "").strip()
         types = data.get("type") or []
-        diagram = _format_diagram(data.get("changes_diagram") or "")
+        diagram_raw = data.get("changes_diagram")
+        diagram = _format_diagram(diagram_raw) if diagram_raw else ""
         mr_files = data.get("mr_files") or []
 
-        project_path = self.bot.gitlab_project_path or ""
-        if project_id is not None:
-            try:
-                project = self.gitlab_client.projects.get(project_id, lazy=True)
-                project_path = project.path_with_namespace
-            except Exception:
-                project_path = self.bot.gitlab_project_path or ""
-
         sections: list[str] = []
 
         if types:
@@ -204,6 +202,15 @@ class DescribeCommand(CommandInterface):
             sections.append(f"### Diagram Walkthrough\n\n{diagram}")
 
         if mr_files:
+            # The project path is only needed for the file links
+            project_path = self.bot.gitlab_project_path or ""
+            if project_id is not None:
+                try:
+                    project = self.gitlab_client.projects.get(project_id, lazy=True)
+                    project_path = project.path_with_namespace
+                except Exception:
+                    project_path = self.bot.gitlab_project_path or ""
+
             file_table = _build_file_table(mr_files, project_path, source_branch)
             if file_table:
                 sections.append(
@@ -214,8 +221,43 @@ class DescribeCommand(CommandInterface):
         body = "\n\n___\n\n".join(sections)
         return f"## Title\n\n{title}\n\n___\n{body}"
 
-    def _render_input(self, input_data: DescribeInput) -> str:
-        return user_template.render(**input_data.model_dump())
-
-    def _render_system_prompt(self, input_data: DescribeInput) -> str:
-        return system_template.render(**input_data.model_dump())
+    def _render_prompts(self, input_data: DescribeInput) -> tuple[str, str]:
+        """Render the (system, user) prompts; the system one only depends on flags."""
+        system_prompt = _cached_system_prompt(
+            input_data.enable_diagram,
+            input_data.enable_files,
+            input_data.enable_file_summary,
+            input_data.extra_instructions,
+        )
+        return system_prompt, _render_user_prompt(**input_data.__dict__)
+
+
+# The output model and the system prompt are pure functions of the command flags,
+# so build them once per flag combination instead of on every run.
+@lru_cache(maxsize=32)
+def _build_describe_model(enable_diagram: bool, enable_files: bool) -> type[BaseModel]:
+    model_fields: dict[str, tuple] = {
+        "type": (list[MRType], ...),
+        "description": (str, ...),
+        "title": (str, ...),
+    }
+    if enable_diagram:
+        model_fields["changes_diagram"] = (str | None, None)
+    if enable_files:
+        model_fields["mr_files"] = (list[FileDescription] | None, None)
+    return create_model("MRDescriptionOutput", **model_fields)
+
+
+@lru_cache(maxsize=32)
+def _cached_system_prompt(
+    enable_diagram: bool,
+    enable_files: bool,
+    enable_file_summary: bool,
+    extra_instructions: str | None,
+) -> str:
+    return system_template.render(
+        enable_diagram=enable_diagram,
+        enable_files=enable_files,
+        enable_file_summary=enable_file_summary,
+        extra_instructions=extra_instructions,
+    )
@@ -4,6 +4,8 @@ from app.core.config import settings
 
 
 class HelpCommand(CommandInterface):
+    __slots__ = ()
+
     async def run(
         self,
         project_id: int,
@@ -32,4 +34,6 @@ Available commands:
 - `/suggest` — Suggest code improvements. **(Not implemented)**
 - `/add_docs` — Add or update documentation related to the merge request. **(Not implemented)**
 
+`/review` and `/describe` reuse their answer for an unchanged merge request for a while; add `--no_cache` to generate a fresh one.
+
 GitLab Agent Dashboard: {settings.frontend_url}"""
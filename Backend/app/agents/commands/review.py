@@ -1,6 +1,8 @@
-from typing import List, Optional
+import asyncio
+from functools import lru_cache
+from types import MappingProxyType
+from typing import TypedDict
 from pydantic import BaseModel, create_model
-from pydantic_ai import AgentRunResult
 
 from .command_interface import CommandInterface, RelatedIssue
 from app.agents.utils import emphasize_header, fetch_file, get_line_link
@@ -8,14 +10,17 @@ from app.prompts.review import system_template, user_template
 from app.core.config import settings
 from app.core.log import logger
 
+# Rendered on every run; bind it once
+_render_user_prompt = user_template.render
+
 
 class ReviewInput(BaseModel):
     title: str
     branch: str
     diff: str
-    description: Optional[str] = None
-    extra_instructions: Optional[str] = None
-    related_issues: Optional[List[RelatedIssue]] = None
+    description: str | None = None
+    extra_instructions: str | None = None
+    related_issues: list[RelatedIssue] | None = None
     require_estimate_effort_to_review: bool = False
     require_score: bool = False
     require_tests: bool = False
@@ -26,7 +31,9 @@ class ReviewInput(BaseModel):
     duplicate_prompt_examples: bool = False
 
 
-class KeyIssuesComponentLink(BaseModel):
+# Leaf output entries are TypedDicts: pydantic still validates them, but they
+# come back as the plain dicts _convert_to_markdown reads anyway.
+class KeyIssuesComponentLink(TypedDict):
     relevant_file: str
     issue_header: str
     issue_content: str
@@ -34,7 +41,7 @@ class KeyIssuesComponentLink(BaseModel):
     end_line: int
 
 
-class IssueCompliance(BaseModel):
+class IssueCompliance(TypedDict):
     issue_id: str
     issue_title: str
     issue_description: str
@@ -43,22 +50,28 @@ class IssueCompliance(BaseModel):
     requires_further_human_verification: str
 
 
-class ReviewCommand(CommandInterface):
-    emojis = {
-        "Can be split": "🔀",
-        "Key issues to review": "⚡",
-        "Recommended focus areas for review": "⚡",
-        "Score": "🏅",
-        "Relevant tests": "🧪",
-        "Focused PR": "✨",
-        "Relevant issue": "🎫",
-        "Security concerns": "🔒",
-        "Insights from user's answers": "📝",
-        "Code feedback": "🤖",
-        "Estimated effort to review": "⏱️",
-        "Issue compliance check": "🎫",
-        "Prompt suggestion for agent": "🤖",
+# Keyed by output field name; read-only and shared by every review
+_EMOJIS = MappingProxyType(
+    {
+        "can_be_split": "🔀",
+        "key_issues_to_review": "⚡",
+        "recommended_focus_areas_for_review": "⚡",
+        "score": "🏅",
+        "relevant_tests": "🧪",
+        "focused_pr": "✨",
+        "relevant_issue": "🎫",
+        "security_concerns": "🔒",
+        "insights_from_user_answers": "📝",
+        "code_feedback": "🤖",
+        "estimated_effort_to_review": "⏱️",
+        "issue_compliance_check": "🎫",
+        "prompt_suggestion_for_agent": "🤖",
     }
+)
+
+
+class ReviewCommand(CommandInterface):
+    __slots__ = ()
 
     async def run(
         self,
@@ -91,66 +104,63 @@ class ReviewCommand(CommandInterface):
         user_prompt = self._render_input(input_data)
 
         # Build MR review output base model dynamically
-        model_fields = {
-            # FIX: Removed the [] brackets around List[...]
-            "issue_compliance_check": (List[IssueCompliance], None)
-            if input_data.related_issues
-            else (None, ...),
-            "estimated_effort_to_review": (Optional[int], None)
-            if input_data.require_estimate_effort_to_review
-            else (None, ...),
-            "score": (Optional[str], None) if input_data.require_score else (None, ...),
-            "relevant_tests": (Optional[str], None)
-            if input_data.require_tests
-            else (None, ...),
-            "security_concerns": (Optional[str], None)
-            if input_data.require_security_review
-            else (None, ...),
-            "prompt_suggestion_for_agent": (Optional[str], None)
-            if input_data.require_prompt_suggestion
-            else (None, ...),
-            "key_issues_to_review": (List[KeyIssuesComponentLink], ...),
-        }
-        # Remove None fields
-        model_fields = {k: v for k, v in model_fields.items() if v[0] is not None}
-        ReviewOutput = create_model(
-            "ReviewOutput",
-            **model_fields,
+        ReviewOutput = _build_review_model(
+            bool(input_data.related_issues),
+            input_data.require_estimate_effort_to_review,
+            input_data.require_score,
+            input_data.require_tests,
+            input_data.require_security_review,
+            input_data.require_prompt_suggestion,
         )
 
         # Build agent
-        self.build_agent(system_prompt, ReviewOutput)
+        agent = self.build_agent(system_prompt, ReviewOutput)
 
         # Get response from agent
-        response: AgentRunResult = await self.agent.run(
-            user_prompt=user_prompt,
+        output_data = await self.run_cached(
+            agent,
+            system_prompt,
+            ReviewOutput,
+            user_prompt,
+            use_cache=not flags.get("no_cache", False),
         )
-        output_data = response.output
 
         # Convert to markdown
-        markdown_text = self._convert_to_markdown(
-            output_data, project_id, input_data.branch
+        markdown_text = await self._convert_to_markdown(
+            output_data,
+            project_id,
+            input_data.branch,
+            gitlab_data.get("project_path", ""),
         )
 
         return markdown_text
 
-    def _convert_to_markdown(
-        self, output_data: BaseModel, project_id: int, source_branch: str
+    async def _convert_to_markdown(
+        self,
+        output_data: BaseModel,
+        project_id: int,
+        source_branch: str,
+        project_path: str = "",
     ) -> str:
         """Convert the model output to the legacy markdown guide."""
+        # Bound once; the section renderers below call these for every issue
+        emphasize = emphasize_header
+        line_link = get_line_link
+        gitlab_base = settings.gitlab.base
+        log_error = logger.error
 
         def _is_value_no(value: object) -> bool:
             return isinstance(value, str) and value.strip().lower() == "no"
 
-        def _issue_markdown_logic(emoji: str, markdown_text: str, value: object) -> str:
-            markdown_text += "<tr><td>"
-            markdown_text += f"{emoji}&nbsp;<strong>Issue compliance check</strong>"
+        def _issue_markdown_logic(emoji: str, value: object) -> None:
+            parts.append("<tr><td>")
+            parts.append(f"{emoji}&nbsp;<strong>Issue compliance check</strong>")
 
             if not value:
-                markdown_text += "</td></tr>\n"
-                return markdown_text
+                parts.append("</td></tr>\n")
+                return
 
-            markdown_text += "<br><br>\n"
+            parts.append("<br><br>\n")
             issues = value if isinstance(value, list) else []
             for issue in issues:
                 if not isinstance(issue, dict):
@@ -165,186 +175,311 @@ class ReviewCommand(CommandInterface):
                 verify = issue.get("requires_further_human_verification", "")
 
                 if title:
-                    markdown_text += f"<strong>{id_str} - {title}</strong><br>"
+                    parts.append(f"<strong>{id_str} - {title}</strong><br>")
                 if description:
-                    markdown_text += f"Issue Description: {description}<br><br>"
+                    parts.append(f"Issue Description: {description}<br><br>")
                 if compliant:
-                    markdown_text += (
-                        emphasize_header(f"Fully compliant: {compliant}") + "<br><br>"
-                    )
+                    parts.append(emphasize(f"Fully compliant: {compliant}"))
+                    parts.append("<br><br>")
                 if not_compliant:
-                    markdown_text += (
-                        emphasize_header(f"Not compliant: {not_compliant}") + "<br><br>"
-                    )
+                    parts.append(emphasize(f"Not compliant: {not_compliant}"))
+                    parts.append("<br><br>")
                 if verify:
-                    markdown_text += (
-                        emphasize_header(f"Needs verification: {verify}") + "<br><br>"
-                    )
-                markdown_text += "<br>"
+                    parts.append(emphasize(f"Needs verification: {verify}"))
+                    parts.append("<br><br>")
+                parts.append("<br>")
 
-            markdown_text += "</td></tr>\n"
-            return markdown_text
+            parts.append("</td></tr>\n")
+
+        # Split lines of every file referenced by a key issue, prefetched below.
+        # Files that are missing or empty are left out.
+        file_lines: dict[str, list[str]] = {}
 
         def _get_snippet(file_path: str, start: int, end: int) -> str:
             if not file_path:
                 return ""
-            content = fetch_file(
-                gitlab_client=self.gitlab_client,
-                project_id=project_id,
-                file_path=file_path,
-                ref=source_branch,
-            )
-            if not content:
+            lines = file_lines.get(file_path)
+            if lines is None:
                 return ""
-            lines = content.splitlines()
             if start <= 0:
                 start_idx = 0
             else:
                 start_idx = max(start - 1, 0)
             end_idx = end if end and end > 0 else start_idx + 1
-            end_idx = min(end_idx, len(lines))
-            snippet_lines = []
-            for idx in range(start_idx, end_idx):
-                snippet_lines.append(f"{idx + 1:5} {lines[idx]}")
-            return "\n".join(snippet_lines)
-
-        markdown_text = "## MR Reviewer Guide 🔍\n\n"
-        markdown_text += "Here are some key observations to aid the review process:\n\n"
-        markdown_text += "<table>\n"
-
-        raw_output = (
-            output_data.model_dump()
-            if isinstance(output_data, BaseModel)
-            else dict(output_data)
-        )
+            return "\n".join(
+                f"{line_no:5} {line}"
+                for line_no, line in enumerate(
+                    lines[start_idx:end_idx], start=start_idx + 1
+                )
+            )
+
+        parts: list[str] = [
+            "## MR Reviewer Guide 🔍\n\n",
+            "Here are some key observations to aid the review process:\n\n",
+            "<table>\n",
+        ]
+
+        # A model iterates over its fields without dumping them; the nested
+        # entries are TypedDicts, so they already are plain dicts
+        raw_output = dict(output_data)
         review_payload = raw_output.get("review", raw_output)
 
-        try:
-            project = self.gitlab_client.projects.get(project_id)
-            project_path = project.path_with_namespace
-        except Exception as exc:  # pragma: no cover - defensive
-            logger.error("Failed to fetch project for markdown links: %s", str(exc))
-            project_path = ""
+        # Fetch each file referenced by a key issue once, all concurrently,
+        # instead of one round-trip per issue while rendering
+        key_issues = review_payload.get("key_issues_to_review")
+        snippet_files = [
+            file_path
+            for file_path in dict.fromkeys(
+                issue.get("relevant_file", "").strip()
+                for issue in (key_issues if isinstance(key_issues, list) else [])
+                if isinstance(issue, dict)
+            )
+            if file_path
+        ]
+        fetches = [
+            asyncio.to_thread(
+                fetch_file,
+                gitlab_client=self.gitlab_client,
+                project_id=project_id,
+                file_path=file_path,
+                ref=source_branch,
+            )
+            for file_path in snippet_files
+        ]
+        # The MR and the bot already know the project path; only ask GitLab
+        # when neither does
+        project_path = project_path or self.bot.gitlab_project_path or ""
+        if not project_path:
+            fetches.append(
+                asyncio.to_thread(self.gitlab_client.projects.get, project_id)
+            )
+        results = await asyncio.gather(*fetches, return_exceptions=True)
 
-        for key, value in review_payload.items():
-            if value is None or value == "" or value == {} or value == []:
-                if key.lower() != "key_issues_to_review":
-                    continue
+        for file_path, content in zip(snippet_files, results):
+            if isinstance(content, str) and content:
+                file_lines[file_path] = content.splitlines()
 
-            key_nice = key.replace("_", " ").capitalize()
-            emoji = self.emojis.get(key_nice, "")
+        if not project_path:
+            project = results[-1]
+            if isinstance(project, Exception):  # pragma: no cover - defensive
+                log_error(
+                    "Failed to fetch project for markdown links: %s", str(project)
+                )
+            else:
+                project_path = project.path_with_namespace
+
+        def _render_effort(emoji: str, value: object) -> None:
+            value_str = str(value).strip()
+            try:
+                value_int = int(value_str.split(",")[0])
+            except Exception:
+                return
+            value_int = max(1, min(5, value_int))
+            bars = "🔵" * value_int + "⚪" * (5 - value_int)
+            parts.append(
+                f"<tr><td>{emoji}&nbsp;<strong>Estimated effort to review</strong>: "
+                f"{value_int} {bars}</td></tr>\n"
+            )
 
-            if "estimated effort to review" in key_nice.lower():
-                value_str = str(value).strip()
-                try:
-                    value_int = int(value_str.split(",")[0])
-                except Exception:
-                    continue
-                value_int = max(1, min(5, value_int))
-                bars = "🔵" * value_int + "⚪" * (5 - value_int)
-                markdown_text += (
-                    f"<tr><td>{emoji}&nbsp;<strong>Estimated effort to review</strong>: "
-                    f"{value_int} {bars}</td></tr>\n"
+        def _render_tests(emoji: str, value: object) -> None:
+            value_str = str(value).strip().lower()
+            parts.append("<tr><td>")
+            if _is_value_no(value_str):
+                parts.append(f"{emoji}&nbsp;<strong>No relevant tests</strong>")
+            else:
+                parts.append(f"{emoji}&nbsp;<strong>MR contains tests</strong>")
+            parts.append("</td></tr>\n")
+
+        def _render_security(emoji: str, value: object) -> None:
+            parts.append("<tr><td>")
+            if _is_value_no(value):
+                parts.append(
+                    f"{emoji}&nbsp;<strong>No security concerns identified</strong>"
                 )
-            elif "relevant tests" in key_nice.lower():
-                value_str = str(value).strip().lower()
-                markdown_text += "<tr><td>"
-                if _is_value_no(value_str):
-                    markdown_text += f"{emoji}&nbsp;<strong>No relevant tests</strong>"
+            else:
+                parts.append(
+                    f"{emoji}&nbsp;<strong>Security concerns</strong><br><br>\n\n"
+                )
+                parts.append(emphasize(str(value).strip()))
+            parts.append("</td></tr>\n")
+
+        def _render_key_issues(emoji: str, value: object) -> None:
+            parts.append("<tr><td>")
+            if _is_value_no(value) or not value:
+                parts.append(f"{emoji}&nbsp;<strong>No major issues detected</strong>")
+                parts.append("</td></tr>\n")
+                return
+
+            parts.append(
+                f"{emoji}&nbsp;<strong>Recommended focus areas for review</strong>"
+                "<br><br>\n\n"
+            )
+            issues = value if isinstance(value, list) else []
+            for issue in issues:
+                if not isinstance(issue, dict):
+                    continue
+                relevant_file = issue.get("relevant_file", "").strip()
+                issue_header = issue.get("issue_header", "").strip()
+                if issue_header.lower() == "possible bug":
+                    issue_header = "Possible Issue"
+                issue_content = issue.get("issue_content", "").strip()
+                start_line = _as_int(issue.get("start_line"))
+                end_line = _as_int(issue.get("end_line"))
+
+                snippet = _get_snippet(relevant_file, start_line, end_line)
+                reference_link = ""
+                if project_path:
+                    try:
+                        reference_link = line_link(
+                            gitlab_base,
+                            project_path,
+                            source_branch,
+                            relevant_file,
+                            start_line,
+                            end_line if end_line else None,
+                        )
+                    except Exception as exc:  # pragma: no cover - defensive
+                        log_error("Failed to build line link: %s", str(exc))
+
+                if reference_link:
+                    header_str = f"<a href='{reference_link}'><strong>{issue_header}</strong></a>"
                 else:
-                    markdown_text += f"{emoji}&nbsp;<strong>MR contains tests</strong>"
-                markdown_text += "</td></tr>\n"
-            elif "issue compliance check" in key_nice.lower():
-                markdown_text = _issue_markdown_logic(emoji, markdown_text, value)
-            elif "security concerns" in key_nice.lower():
-                markdown_text += "<tr><td>"
-                if _is_value_no(value):
-                    markdown_text += (
-                        f"{emoji}&nbsp;<strong>No security concerns identified</strong>"
+                    header_str = f"<strong>{issue_header}</strong>"
+
+                if snippet:
+                    issue_str = (
+                        f"<details><summary>{header_str}\n\n{issue_content}"
+                        "</summary>\n\n"
+                        f"```{relevant_file.split('.')[-1] if relevant_file else ''}\n"
+                        f"{snippet}\n```"
+                        "\n</details>"
                     )
                 else:
-                    markdown_text += (
-                        f"{emoji}&nbsp;<strong>Security concerns</strong><br><br>\n\n"
-                    )
-                    markdown_text += emphasize_header(str(value).strip())
-                markdown_text += "</td></tr>\n"
-            elif "key issues to review" in key_nice.lower():
-                markdown_text += "<tr><td>"
-                if _is_value_no(value) or not value:
-                    markdown_text += (
-                        f"{emoji}&nbsp;<strong>No major issues detected</strong>"
-                    )
-                    markdown_text += "</td></tr>\n"
-                    continue
+                    issue_str = f"{header_str}<br>{issue_content}"
 
-                markdown_text += (
-                    f"{emoji}&nbsp;<strong>Recommended focus areas for review</strong>"
-                    "<br><br>\n\n"
+                parts.append(f"{issue_str}\n\n")
+
+            parts.append("</td></tr>\n")
+
+        def _render_prompt_suggestion(emoji: str, value: object) -> None:
+            parts.append("<tr><td>")
+            if _is_value_no(value):
+                parts.append(
+                    f"{emoji}&nbsp;<strong>No prompt suggestion provided</strong>"
                 )
-                issues = value if isinstance(value, list) else []
-                for issue in issues:
-                    if not isinstance(issue, dict):
-                        continue
-                    relevant_file = issue.get("relevant_file", "").strip()
-                    issue_header = issue.get("issue_header", "").strip()
-                    if issue_header.lower() == "possible bug":
-                        issue_header = "Possible Issue"
-                    issue_content = issue.get("issue_content", "").strip()
-                    start_line = int(str(issue.get("start_line", 0) or 0))
-                    end_line = int(str(issue.get("end_line", 0) or 0))
-
-                    snippet = _get_snippet(relevant_file, start_line, end_line)
-                    reference_link = ""
-                    if project_path:
-                        try:
-                            reference_link = get_line_link(
-                                settings.gitlab.base,
-                                project_path,
-                                source_branch,
-                                relevant_file,
-                                start_line,
-                                end_line if end_line else None,
-                            )
-                        except Exception as exc:  # pragma: no cover - defensive
-                            logger.error("Failed to build line link: %s", str(exc))
-
-                    if reference_link:
-                        header_str = f"<a href='{reference_link}'><strong>{issue_header}</strong></a>"
-                    else:
-                        header_str = f"<strong>{issue_header}</strong>"
-
-                    if snippet:
-                        issue_str = (
-                            f"<details><summary>{header_str}\n\n{issue_content}"
-                            "</summary>\n\n"
-                            f"```{relevant_file.split('.')[-1] if relevant_file else ''}\n"
-                            f"{snippet}\n```"
-                            "\n</details>"
-                        )
-                    else:
-                        issue_str = f"{header_str}<br>{issue_content}"
+            else:
+                parts.append(
+                    f"{emoji}&nbsp;<strong>Prompt suggestion for comprehensive review by agent</strong><br><br>\n\n"
+                )
+                parts.append(emphasize(str(value).strip()))
+            parts.append("</td></tr>\n")
+
+        # Output field name -> renderer; other fields get a plain row
+        handlers = {
+            "estimated_effort_to_review": _render_effort,
+            "relevant_tests": _render_tests,
+            "issue_compliance_check": _issue_markdown_logic,
+            "security_concerns": _render_security,
+            "key_issues_to_review": _render_key_issues,
+            "prompt_suggestion_for_agent": _render_prompt_suggestion,
+        }
 
-                    markdown_text += f"{issue_str}\n\n"
+        for key, value in review_payload.items():
+            if value is None or (isinstance(value, (str, list, dict)) and not value):
+                if key.lower() != "key_issues_to_review":
+                    continue
 
-                markdown_text += "</td></tr>\n"
-            elif "prompt suggestion for agent" in key_nice.lower():
-                markdown_text += "<tr><td>"
-                if _is_value_no(value):
-                    markdown_text += (
-                        f"{emoji}&nbsp;<strong>No prompt suggestion provided</strong>"
-                    )
-                else:
-                    markdown_text += f"{emoji}&nbsp;<strong>Prompt suggestion for comprehensive review by agent</strong><br><br>\n\n"
-                    markdown_text += emphasize_header(str(value).strip())
-                markdown_text += "</td></tr>\n"
+            emoji = _EMOJIS.get(key, "")
+            handler = handlers.get(key)
+            if handler is not None:
+                handler(emoji, value)
             else:
-                markdown_text += f"<tr><td>{emoji}&nbsp;<strong>{key_nice}</strong>: {value}</td></tr>\n"
+                key_nice = key.replace("_", " ").capitalize()
+                parts.append(
+                    f"<tr><td>{emoji}&nbsp;<strong>{key_nice}</strong>: {value}</td></tr>\n"
+                )
 
-        markdown_text += "</table>\n"
-        return markdown_text
+        parts.append("</table>\n")
+        return "".join(parts)
 
     def _render_input(self, input_data: ReviewInput) -> str:
-        return user_template.render(**input_data.model_dump())
+        return _render_user_prompt(**input_data.__dict__)
 
     def _render_system_prompt(self, input_data: ReviewInput) -> str:
-        return system_template.render(**input_data.model_dump())
\ No newline at end of file
+        return _cached_system_prompt(
+            bool(input_data.related_issues),
+            input_data.require_estimate_effort_to_review,
+            input_data.require_score,
+            input_data.require_tests,
+            input_data.require_security_review,
+            input_data.require_prompt_suggestion,
+            input_data.num_max_findings,
+            input_data.is_ai_metadata,
+            input_data.extra_instructions,
+        )
+
+
+def _as_int(value: object, default: int = 0) -> int:
+    """Coerce an output line number; validated outputs already hold ints."""
+    if isinstance(value, int):
+        return value
+    return int(value) if value else default
+
+
+# The output model and the system prompt are pure functions of the command flags,
+# so build them once per flag combination instead of on every run.
+@lru_cache(maxsize=32)
+def _build_review_model(
+    has_related_issues: bool,
+    require_estimate_effort_to_review: bool,
+    require_score: bool,
+    require_tests: bool,
+    require_security_review: bool,
+    require_prompt_suggestion: bool,
+) -> type[BaseModel]:
+    # Only ask for the sections that were requested; field order is the order
+    # of the rendered guide
+    model_fields: dict[str, tuple] = {}
+    if has_related_issues:
+        model_fields["issue_compliance_check"] = (list[IssueCompliance], None)
+    if require_estimate_effort_to_review:
+        model_fields["estimated_effort_to_review"] = (int | None, None)
+    if require_score:
+        model_fields["score"] = (str | None, None)
+    if require_tests:
+        model_fields["relevant_tests"] = (str | None, None)
+    if require_security_review:
+        model_fields["security_concerns"] = (str | None, None)
+    if require_prompt_suggestion:
+        model_fields["prompt_suggestion_for_agent"] = (str | None, None)
+    model_fields["key_issues_to_review"] = (list[KeyIssuesComponentLink], ...)
+    return create_model(
+        "ReviewOutput",
+        **model_fields,
+    )
+
+
+@lru_cache(maxsize=32)
+def _cached_system_prompt(
+    has_related_issues: bool,
+    require_estimate_effort_to_review: bool,
+    require_score: bool,
+    require_tests: bool,
+    require_security_review: bool,
+    require_prompt_suggestion: bool,
+    num_max_findings: int,
+    is_ai_metadata: bool,
+    extra_instructions: str | None,
+) -> str:
+    # The system template only checks related_issues for truthiness
+    return system_template.render(
+        related_issues=has_related_issues,
+        require_estimate_effort_to_review=require_estimate_effort_to_review,
+        require_score=require_score,
+        require_tests=require_tests,
+        require_security_review=require_security_review,
+        require_prompt_suggestion=require_prompt_suggestion,
+        num_max_findings=num_max_findings,
+        is_ai_metadata=is_ai_metadata,
+        extra_instructions=extra_instructions,
+    )
\ No newline at end of file
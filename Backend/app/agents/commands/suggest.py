@@ -50,10 +50,10 @@ class SuggestCommand:
         pass
 
     def _render_input(self, input_data: SuggestInput) -> str:
-        return user_template.render(**input_data.model_dump())
+        return user_template.render(**input_data.__dict__)
 
     def _render_system_prompt(self, input_data: SuggestInput) -> str:
-        return system_template.render(**input_data.model_dump())
+        return system_template.render(**input_data.__dict__)
 
 
 class CodeSuggestionFeedback(BaseModel):
@@ -77,11 +77,13 @@ class SuggestFeedbackInput(BaseModel):
 
 
 class SuggestFeedbackCommand(CommandInterface):
+    __slots__ = ()
+
     async def run(self, flags: dict[str, str | bool], args: list[str]) -> str:
         pass
 
     def _render_input(self, input_data: SuggestFeedbackInput) -> str:
-        return reflect_user_template.render(**input_data.model_dump())
+        return reflect_user_template.render(**input_data.__dict__)
 
     def _render_system_prompt(self, input_data: SuggestFeedbackInput) -> str:
-        return reflect_system_template.render(**input_data.model_dump())
+        return reflect_system_template.render(**input_data.__dict__)
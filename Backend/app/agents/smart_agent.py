@@ -1,5 +1,9 @@
+import asyncio
+import fnmatch
+import hashlib
+import re
+import threading
 import gitlab
-import requests
 import datetime as dt
 from pydantic_ai import (
     Agent,
@@ -7,32 +11,66 @@ from pydantic_ai import (
     ModelMessage,
     ModelRequest,
     SystemPromptPart,
+    UserPromptPart,
+    ToolCallPart,
     AgentRunResult,
     ModelMessagesTypeAdapter,
 )
-from pydantic_ai.models.openai import OpenAIChatModel, OpenAIChatModelSettings
-from pydantic_ai.providers.openrouter import OpenRouterProvider
+from pydantic_ai.models.openai import OpenAIChatModelSettings
 from pymongo.database import Database
 from bson import ObjectId
+from cachetools import TTLCache
 
-from app.agents.utils import token_counter
+from app.agents.utils import build_openrouter_model, model_cache_key, token_counter
 from app.core.config import settings
 from app.core.log import logger
 from app.db.models import Bot, MrAgentHistory
+from app.services.cache_service import CacheService
 from app.prompts.smart_agent import SMART_AGENT_SYSTEM_PROMPT, SMART_AGENT_USER_PROMPT
 
+# Diffs of files matching these names are left out of the agent context
+_SKIP_FILE_GLOBS = (
+    "*.lock",
+    "package-lock.json",
+    "pnpm-lock.yaml",
+    "*.min.js",
+    "*.min.css",
+    "*_pb2.py",
+    "*.svg",
+    "*.png",
+)
+_SKIP_FILE_RE = re.compile("|".join(fnmatch.translate(g) for g in _SKIP_FILE_GLOBS))
+
+# Part of the cached review key; bump it whenever the prompts or the context
+# layout change so reviews produced by the old wording are not served again
+_REVIEW_PROMPT_VERSION = 1
+
+# Files the agent reads through get_file, shared across runs for a few minutes
+# so follow-up questions on the same MR skip the GitLab round trip. Keyed by
+# (project_id, head commit sha, file_path), so a push to the branch never
+# serves stale content. pydantic-ai runs sync tools in worker threads, and
+# TTLCache is not thread-safe (even get() may expire entries), so this is a
+# threading.Lock; an asyncio.Lock cannot be taken from sync tool code.
+_file_cache: TTLCache = TTLCache(maxsize=512, ttl=300)
+_file_cache_lock = threading.Lock()
+
 
 # Tools
 def tools_wrapper(
-    gitlab_client: gitlab.Gitlab, mr_iid: int, project_id: int, source_branch: str
+    project: "gitlab.v4.objects.Project",
+    mr: "gitlab.v4.objects.ProjectMergeRequest",
 ) -> list[callable]:
     """Return the list of tools available to the Smart Agent."""
+    # The tools act on the project and MR the run already fetched
+    mr_iid = mr.iid
+    project_id = project.id
+    # Read files at the MR head commit so they match the diff being discussed
+    head_sha = mr.sha
+    ref = head_sha or mr.source_branch
 
     def approve_mr() -> str:
         """Tool to approve a GitLab Merge Request. Use this tool only one time per conversation. If you have already approved the merge request you might get an error (permission error)."""
         try:
-            project = gitlab_client.projects.get(project_id, lazy=True)
-            mr = project.mergerequests.get(mr_iid)
             mr.approve()
             return "Approved the merge request."
         except gitlab.GitlabError as e:
@@ -44,8 +82,6 @@ def tools_wrapper(
     def unapprove_mr() -> str:
         """Tool to unapprove a GitLab Merge Request. You might get error if you have not approved it yet. Use this tool only one time per conversation."""
         try:
-            project = gitlab_client.projects.get(project_id, lazy=True)
-            mr = project.mergerequests.get(mr_iid)
             mr.unapprove()
             return "Unapproved the merge request."
         except gitlab.GitlabError as e:
@@ -56,18 +92,46 @@ def tools_wrapper(
 
     def get_file(file_path: str) -> str:
         """Tool to get the content of a file in the GitLab repository. given its path. you can use this tool only 2 times per conversation."""
-        project = gitlab_client.projects.get(project_id, lazy=True)
+        cache_key = (project_id, head_sha, file_path)
+        if head_sha:
+            with _file_cache_lock:
+                file_content = _file_cache.get(cache_key)
+            if file_content is not None:
+                return file_content
+
         try:
-            file = project.files.get(file_path=file_path, ref=source_branch)
-            file_content = file.decode().decode("utf-8")
+            # A character is at most 4 UTF-8 bytes, so past this many bytes the
+            # file is over the token limit whatever it contains
+            max_bytes = (settings.max_tokens_per_file + 1) * 16
+            # Stream the raw file instead of fetching it base64-encoded, and
+            # stop reading as soon as it is known to be too large
+            file_bytes = bytearray()
+            for chunk in project.files.raw(
+                file_path=file_path,
+                ref=ref,
+                streamed=True,
+                chunk_size=64 * 1024,
+                iterator=True,
+            ):
+                file_bytes += chunk
+                if len(file_bytes) >= max_bytes:
+                    return f"Error: The file {file_path} is too large to retrieve."
+            file_content = file_bytes.decode("utf-8")
             if token_counter(file_content) > settings.max_tokens_per_file:
                 return f"Error: The file {file_path} is too large to retrieve."
+            # Only files the agent is allowed to see are kept, and only when
+            # they are pinned to a commit
+            if head_sha:
+                with _file_cache_lock:
+                    _file_cache[cache_key] = file_content
             return file_content
         except gitlab.GitlabError as e:
             logger.error(
-                f"Failed to retrieve file {file_path} from project {project_id} at branch {source_branch}, Error: {str(e)}"
+                f"Failed to retrieve file {file_path} from project {project_id} at {ref}, Error: {str(e)}"
             )
             return "Error: " + str(e)
+        except UnicodeDecodeError:
+            return f"Error: The file {file_path} is not a text file."
 
     return [approve_mr, unapprove_mr, get_file]
 
@@ -96,10 +160,8 @@ class SmartAgent:
             max_tokens=max_tokens,
             extra_body=extra_body,
         )
-        self.model = OpenAIChatModel(
-            model_name=model_name,
-            settings=self.model_settings,
-            provider=OpenRouterProvider(api_key=openrouter_api_key),
+        self.model = build_openrouter_model(
+            model_name, self.model_settings, openrouter_api_key
         )
         self.gitlab_client = gitlab_client
         self.mongo_db = mongo_db
@@ -108,19 +170,31 @@ class SmartAgent:
 
     def gather_context(self, mr: "gitlab.v4.objects.ProjectMergeRequest") -> str:
         """Gather context for the merge request including diffs, title, and description."""
-        # Fetch MR details from GitLab
-        mr_diffs = mr.diffs.get(mr.diffs.list(page=1, per_page=1)[0].id).diffs
+        # Fetch the latest diff in a single request, instead of listing diff
+        # versions and then fetching the newest one
+        changes = mr.changes()
+        mr_diffs = changes.get("changes", [])
 
         # Build context string
-        context_lines: list[str] = []
-        context_lines.append(f"Merge Request Title: {mr.title}")
-        context_lines.append(f"Merge Request Description: {mr.description}")
-        context_lines.append("")
+        context_lines: list[str] = [
+            f"Merge Request Title: {changes.get('title')}",
+            f"Merge Request Description: {changes.get('description')}",
+            "",
+        ]
 
         ignored_files = []
+        generated_files = []
         for diff in mr_diffs:
+            # Lockfiles, minified bundles and generated code cost many tokens
+            # and are not worth reviewing; skip them by name before anything else
+            file_path = diff.get("new_path") or diff.get("old_path") or ""
+            if _SKIP_FILE_RE.match(file_path.rpartition("/")[2]):
+                generated_files.append(file_path)
+                continue
+
+            diff_text = diff.get("diff", "")
             # Skip diffs that are too large (token-based)
-            if token_counter(diff.get("diff", "")) > settings.max_tokens_per_diff:
+            if token_counter(diff_text) > settings.max_tokens_per_diff:
                 ignored_files.append(
                     diff.get("new_path", "") or diff.get("old_path", "unknown")
                 )
@@ -139,34 +213,33 @@ class SmartAgent:
                 status = "modified"
 
             # Determine diff availability
+            diff_text = diff_text.strip()
             can_review = (
                 not getattr(diff, "too_large", False)
                 and not getattr(diff, "collapsed", False)
-                and bool(diff.get("diff", "").strip())
+                and bool(diff_text)
             )
-            diff_text = diff.get("diff", "").strip() if can_review else None
-
-            # Append file block
-            context_lines.append("### File")
-            context_lines.append(f"old_path: {diff.get('old_path')}")
-            context_lines.append(f"new_path: {diff.get('new_path')}")
-            context_lines.append(f"status: {status}")
-            context_lines.append(f"can_review_diff: {str(can_review).lower()}")
-            context_lines.append("")
-
-            if can_review:
-                context_lines.append("Diff:")
-                context_lines.append(diff_text)
-            else:
-                context_lines.append("Diff unavailable")
+            diff_body = f"Diff:\n{diff_text}" if can_review else "Diff unavailable"
 
-            context_lines.append("")
+            # One entry per file block; the final join supplies the newlines
+            context_lines.append(
+                "### File\n"
+                f"old_path: {diff.get('old_path')}\n"
+                f"new_path: {diff.get('new_path')}\n"
+                f"status: {status}\n"
+                f"can_review_diff: {str(can_review).lower()}\n"
+                f"\n{diff_body}\n"
+            )
 
         # Summary of skipped files
         if ignored_files:
             context_lines.append(
                 f"Note: The following files were skipped due to size constraints: {', '.join(ignored_files)}"
             )
+        if generated_files:
+            context_lines.append(
+                f"Note: The following lock, minified or generated files were skipped: {', '.join(generated_files)}"
+            )
 
         return "\n".join(context_lines)
 
@@ -194,51 +267,93 @@ class SmartAgent:
         history_id: ObjectId | None = None
         project = None
         mr = None
+        cache_service = CacheService(self.mongo_db)
+        cache_key: str | None = None
 
         try:
             logger.info(
                 f"Starting Smart Agent run for MR {mr_iid} in project {project_id}"
             )
 
-            # Fetch MR details
-            project = self.gitlab_client.projects.get(project_id)
-            mr = project.mergerequests.get(mr_iid)
-
-            # Initialize the history once MR and project data are available
-            history_id = self._start_history(
+            # The project, the MR and its diff are independent GitLab requests,
+            # so send them together. The diff is read through a lazy MR; the
+            # changes response carries the title and description as well
+            lazy_project = self.gitlab_client.projects.get(project_id, lazy=True)
+            project, mr, context = await asyncio.gather(
+                asyncio.to_thread(self.gitlab_client.projects.get, project_id),
+                asyncio.to_thread(lazy_project.mergerequests.get, mr_iid),
+                asyncio.to_thread(
+                    self.gather_context,
+                    mr=lazy_project.mergerequests.get(mr_iid, lazy=True),
+                ),
+                return_exceptions=True,
+            )
+            if isinstance(project, Exception):
+                raise project
+            if isinstance(mr, Exception):
+                raise mr
+
+            # Initialize the history once MR and project data are available, so
+            # a failed context fetch is still recorded against it
+            history_id = await asyncio.to_thread(
+                self._start_history,
                 mr=mr,
                 project=project,
                 request_type=request_type,
             )
+            if isinstance(context, Exception):
+                raise context
+
+            # A review depends only on the bot, the model and its settings, the
+            # prompts and the MR diff, so webhook retries and re-requested
+            # reviews of an unchanged MR reuse the stored answer. The cache is
+            # shared by every bot and project, and one head commit can belong
+            # to several MRs with different bases, so the key names the MR and
+            # all of its diff refs. Note replies also depend on the discussion
+            # and are always run.
+            diff_refs = mr.diff_refs or {}
+            if request_type == "mr_review" and diff_refs.get("head_sha"):
+                digest = hashlib.blake2b(
+                    f"{_REVIEW_PROMPT_VERSION}|{self.bot.id}|{project_id}|{mr_iid}|"
+                    f"{diff_refs.get('base_sha')}|{diff_refs.get('start_sha')}|"
+                    f"{diff_refs.get('head_sha')}|"
+                    f"{model_cache_key(self.model.model_name, self.model_settings)}|"
+                    f"{system_prompt}|{user_prompt}".encode(),
+                    digest_size=16,
+                ).hexdigest()
+                cache_key = f"smart_agent_output:{digest}"
+                cached_output = await asyncio.to_thread(cache_service.get, cache_key)
+                if cached_output is not None:
+                    await asyncio.to_thread(
+                        self._update_history,
+                        document_id=history_id,
+                        status="cache_hit",
+                        error_message=None,
+                    )
+                    return cached_output
+
+            # Keep the system prompt identical across runs so providers can
+            # serve it from their prompt cache; the MR context varies, so it
+            # goes in a user message right after it
+            context_request = ModelRequest(
+                parts=[
+                    SystemPromptPart(content=system_prompt),
+                    UserPromptPart(content=f"### Merge Request Context:\n{context}"),
+                ]
+            )
+            message_history = [context_request, *(message_history or [])]
 
-            # Gather context
-            context = self.gather_context(mr=mr)
-
-            # Append context to system prompt
-            system_prompt = f"{system_prompt}\n\n### Merge Request Context:\n{context}"
-
-            # Initialize the agent
+            # Initialize the agent. No system_prompt here: pydantic-ai only adds
+            # one when the history is empty, and context_request carries it
             self.agent = Agent(
                 model=self.model,
-                tools=tools_wrapper(
-                    gitlab_client=self.gitlab_client,
-                    mr_iid=mr_iid,
-                    project_id=project_id,
-                    source_branch=mr.source_branch,
-                ),
-                system_prompt=system_prompt,
+                tools=tools_wrapper(project=project, mr=mr),
             )
 
-            # Add system prompt as the first message of the history if history is provided
-            if message_history is not None:
-                message_history.insert(
-                    0, ModelRequest(parts=[SystemPromptPart(content=system_prompt)])
-                )
-
             # Run the agent
             response = await self.agent.run(
                 user_prompt=user_prompt,
-                message_history=message_history or [],
+                message_history=message_history,
                 usage_limits=UsageLimits(tool_calls_limit=3),
             )
         except Exception as e:
@@ -247,7 +362,8 @@ class SmartAgent:
             )
             # Update history with failure
             if history_id:
-                self._update_history(
+                await asyncio.to_thread(
+                    self._update_history,
                     document_id=history_id,
                     status="failed",
                     error_message=str(e),
@@ -263,16 +379,11 @@ class SmartAgent:
             cache_write_tokens = usage.cache_write_tokens or 0
             messages_json_str = response.all_messages_json().decode("utf-8")
             if history_id:
-                self._update_history(
+                # MR, project and request details were written by _start_history
+                await asyncio.to_thread(
+                    self._update_history,
                     document_id=history_id,
-                    mr_title=mr.title if mr else None,
-                    mr_web_url=mr.web_url if mr else None,
-                    project_path_with_namespace=project.path_with_namespace
-                    if project
-                    else None,
-                    project_web_url=project.web_url if project else None,
                     messages_json_str=messages_json_str,
-                    request_type=request_type,
                     input_tokens=input_tokens,
                     cache_read_tokens=cache_read_tokens,
                     cache_write_tokens=cache_write_tokens,
@@ -282,6 +393,20 @@ class SmartAgent:
                 )
             else:
                 logger.error("History ID is missing; skipping history update.")
+            # Tool calls act on the MR (approve, unapprove) or read files
+            # outside the diff, so those answers are not safe to replay
+            used_tools = any(
+                isinstance(part, ToolCallPart)
+                for message in response.new_messages()
+                for part in message.parts
+            )
+            if cache_key and not used_tools:
+                await asyncio.to_thread(
+                    cache_service.set,
+                    cache_key,
+                    response.output,
+                    ttl_seconds=settings.llm_output_cache_ttl_seconds,
+                )
         except Exception as e:
             logger.error(f"Failed to update agent run history: {str(e)}")
 
@@ -339,32 +464,23 @@ class SmartAgent:
             return
         history_collection = self.mongo_db["mr_agent_history"]
 
+        optional_fields: dict[str, object] = {
+            "mr_title": mr_title,
+            "mr_web_url": mr_web_url,
+            "project_path_with_namespace": project_path_with_namespace,
+            "project_web_url": project_web_url,
+            "messages_json_str": messages_json_str,
+            "request_type": request_type,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "cache_read_tokens": cache_read_tokens,
+            "cache_write_tokens": cache_write_tokens,
+            "status": status,
+        }
         update_fields: dict[str, object] = {
-            "updated_at": dt.datetime.now(dt.timezone.utc),
+            name: value for name, value in optional_fields.items() if value is not None
         }
-
-        if mr_title is not None:
-            update_fields["mr_title"] = mr_title
-        if mr_web_url is not None:
-            update_fields["mr_web_url"] = mr_web_url
-        if project_path_with_namespace is not None:
-            update_fields["project_path_with_namespace"] = project_path_with_namespace
-        if project_web_url is not None:
-            update_fields["project_web_url"] = project_web_url
-        if messages_json_str is not None:
-            update_fields["messages_json_str"] = messages_json_str
-        if request_type is not None:
-            update_fields["request_type"] = request_type
-        if input_tokens is not None:
-            update_fields["input_tokens"] = input_tokens
-        if output_tokens is not None:
-            update_fields["output_tokens"] = output_tokens
-        if cache_read_tokens is not None:
-            update_fields["cache_read_tokens"] = cache_read_tokens
-        if cache_write_tokens is not None:
-            update_fields["cache_write_tokens"] = cache_write_tokens
-        if status is not None:
-            update_fields["status"] = status
+        update_fields["updated_at"] = dt.datetime.now(dt.timezone.utc)
         # allow clearing/setting error message explicitly
         if error_message is not None or status is not None:
             update_fields["error_message"] = error_message
@@ -374,14 +490,6 @@ class SmartAgent:
             {"$set": update_fields},
         )
 
-    def _get_openrouter_cost(self, provider_response_id: str):
-        url = "https://openrouter.ai/api/v1/generation"
-
-        querystring = {"id": provider_response_id}
-        headers = {"Authorization": f"Bearer {self.openrouter_api_key}"}
-        response = requests.get(url, headers=headers, params=querystring)
-        print(response.json())
-
     @staticmethod
     def get_history(
         project_id: int,
@@ -1,56 +1,81 @@
+from collections.abc import Mapping
 from typing import Optional
+import json
 import gitlab
+from pydantic_ai.models.openai import OpenAIChatModel, OpenAIChatModelSettings
+from pydantic_ai.providers.openrouter import OpenRouterProvider
 
 from app.core.log import logger
 
 
+class _AnthropicCacheChatModel(OpenAIChatModel):
+    """OpenAI-compatible chat model that marks the system prompt as an Anthropic cache breakpoint."""
+
+    async def _map_messages(self, *args, **kwargs):
+        openai_messages = await super()._map_messages(*args, **kwargs)
+        # Anthropic only caches up to an explicit breakpoint, and OpenRouter
+        # passes cache_control through on content parts. Everything up to the
+        # last system message is stable across runs, so mark that one.
+        for message in reversed(openai_messages):
+            if message.get("role") == "system":
+                content = message["content"]
+                if isinstance(content, str):
+                    content = [{"type": "text", "text": content}]
+                content[-1]["cache_control"] = {"type": "ephemeral"}
+                message["content"] = content
+                break
+        return openai_messages
+
+
+def build_openrouter_model(
+    model_name: str, model_settings: OpenAIChatModelSettings, api_key: str
+) -> OpenAIChatModel:
+    """Build the OpenRouter chat model for a bot, with prompt caching for Anthropic models."""
+    # OpenAI and most other providers cache long prefixes automatically
+    model_class = (
+        _AnthropicCacheChatModel
+        if model_name.startswith("anthropic/")
+        else OpenAIChatModel
+    )
+    return model_class(
+        model_name=model_name,
+        settings=model_settings,
+        provider=OpenRouterProvider(api_key=api_key),
+    )
+
+
 def token_counter(text: str) -> int:
     """A simple token counter based on character count."""
     return len(text) // 4  # Approximate 4 characters per token
 
 
-def emphasize_header(text: str, only_markdown=False, reference_link=None) -> str:
-    try:
-        # Finding the position of the first occurrence of ": "
-        colon_position = text.find(": ")
-
-        # Splitting the string and wrapping the first part in <strong> tags
-        if colon_position != -1:
-            # Everything before the colon (inclusive) is wrapped in <strong> tags
-            if only_markdown:
-                if reference_link:
-                    transformed_string = (
-                        f"[**{text[: colon_position + 1]}**]({reference_link})\n"
-                        + text[colon_position + 1 :]
-                    )
-                else:
-                    transformed_string = (
-                        f"**{text[: colon_position + 1]}**\n"
-                        + text[colon_position + 1 :]
-                    )
-            else:
-                if reference_link:
-                    transformed_string = (
-                        f"<strong><a href='{reference_link}'>{text[: colon_position + 1]}</a></strong><br>"
-                        + text[colon_position + 1 :]
-                    )
-                else:
-                    transformed_string = (
-                        "<strong>"
-                        + text[: colon_position + 1]
-                        + "</strong>"
-                        + "<br>"
-                        + text[colon_position + 1 :]
-                    )
-        else:
-            # If there's no ": ", return the original string
-            transformed_string = text
+def model_cache_key(model_name: str, model_settings: Mapping | None) -> str:
+    """Return a stable string for a model and its settings, for use in cache keys."""
+    return json.dumps(
+        {"model": model_name, "settings": model_settings or {}},
+        sort_keys=True,
+        default=str,
+    )
 
-        return transformed_string
-    except Exception as e:
-        logger.exception(f"Failed to emphasize header: {e}")
+
+def emphasize_header(text: str, only_markdown=False, reference_link=None) -> str:
+    # Finding the position of the first occurrence of ": "
+    colon_position = text.find(": ")
+    # If there's no ": ", return the original string
+    if colon_position == -1:
         return text
 
+    # Everything before the colon (inclusive) is emphasized
+    header = text[: colon_position + 1]
+    rest = text[colon_position + 1 :]
+    if only_markdown:
+        if reference_link:
+            return f"[**{header}**]({reference_link})\n{rest}"
+        return f"**{header}**\n{rest}"
+    if reference_link:
+        return f"<strong><a href='{reference_link}'>{header}</a></strong><br>{rest}"
+    return f"<strong>{header}</strong><br>{rest}"
+
 
 def fetch_file(
     gitlab_client: gitlab.Gitlab,
@@ -1,13 +1,14 @@
+import asyncio
 import datetime as dt
 
 import gitlab
-import httpx
+from cachetools import TTLCache
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pymongo.database import Database
 from pymongo.errors import PyMongoError
 
-from app.auth.gitlab import GitlabAuthService
+from app.auth.gitlab import GitlabAuthService, get_http_client
 from app.auth.jwt import decode_token
 from app.core.config import settings
 from app.core.log import logger
@@ -17,11 +18,35 @@ from app.db.models import OAuthAccount, Users
 
 security = HTTPBearer(auto_error=True)
 
+# Validated access tokens -> (user, valid until). Saves the JWT decode and two
+# Mongo lookups on repeated requests. Logout and refresh evict the session's
+# token through the jti index; other revocations take effect within the TTL.
+_auth_cache: TTLCache = TTLCache(maxsize=10_000, ttl=60)
+# Session jti -> cached access token. Each access token carries its session's
+# current jti, so one entry per jti is enough.
+_auth_cache_jti_index: TTLCache = TTLCache(maxsize=10_000, ttl=60)
+
+# user id -> (GitLab client, access token expiry). Reusing the client keeps its
+# HTTP session, and the connections to GitLab, alive between requests.
+_gitlab_client_cache: TTLCache = TTLCache(maxsize=1024, ttl=300)
+
 
 def _utcnow() -> dt.datetime:
     return utc_now()
 
 
+def evict_auth_cache(jti: str) -> None:
+    """Forget the cached access token of the session identified by `jti`."""
+    token = _auth_cache_jti_index.pop(jti, None)
+    if token is not None:
+        _auth_cache.pop(token, None)
+
+
+def evict_gitlab_client(user_id: int) -> None:
+    """Forget the cached GitLab client of `user_id`, e.g. after its token changed."""
+    _gitlab_client_cache.pop(user_id, None)
+
+
 async def get_current_user(
     mongo_db: Database = Depends(get_mongo_database),
     credentials: HTTPAuthorizationCredentials = Depends(security),
@@ -31,6 +56,12 @@ async def get_current_user(
     Usage: async def endpoint(current_user: Users = Depends(get_current_user))
     """
     token = credentials.credentials
+    cached = _auth_cache.get(token)
+    if cached is not None:
+        user, valid_until = cached
+        if valid_until > _utcnow():
+            return user
+
     try:
         payload = decode_token(token)
     except Exception as exc:  # pragma: no cover - defensive
@@ -48,7 +79,12 @@ async def get_current_user(
             detail="Invalid authentication credentials",
         )
 
-    refresh_session = mongo_db["refresh_sessions"].find_one({"jti": jti})
+    # Only the expiry is checked
+    refresh_session = await asyncio.to_thread(
+        mongo_db["refresh_sessions"].find_one,
+        {"jti": jti},
+        {"expires_at": 1, "_id": 0},
+    )
     expires_at = (
         ensure_utc(refresh_session.get("expires_at")) if refresh_session else None
     )
@@ -59,7 +95,9 @@ async def get_current_user(
         )
 
     try:
-        user_doc = mongo_db["users"].find_one({"id": int(user_id)})
+        user_doc = await asyncio.to_thread(
+            mongo_db["users"].find_one, {"id": int(user_id)}
+        )
     except (TypeError, ValueError):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -72,6 +110,15 @@ async def get_current_user(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found",
         )
+
+    valid_until = expires_at
+    token_exp = payload.get("exp")
+    if token_exp is not None:
+        valid_until = min(
+            valid_until, dt.datetime.fromtimestamp(token_exp, dt.timezone.utc)
+        )
+    _auth_cache[token] = (user, valid_until)
+    _auth_cache_jti_index[jti] = token
     return user
 
 
@@ -83,13 +130,28 @@ async def get_gitlab_client(
     Dependency to get the GitLab client for the current user.
     Usage: async def endpoint(gitlab_client: gitlab.Gitlab = Depends(get_gitlab_client))
     """
-    account_doc = mongo_db["oauth_accounts"].find_one(
-        {"user_id": current_user.id, "provider": "gitlab"}
+    cached = _gitlab_client_cache.get(current_user.id)
+    if cached is not None:
+        gitlab_client, token_expires_at = cached
+        # Without a known expiry the token may already be dead, so only a
+        # client whose token is known to be valid is reused
+        if token_expires_at is not None and token_expires_at > _utcnow():
+            return gitlab_client
+
+    # The stored GitLab profile is never needed here and is the bulk of the
+    # document; OAuthAccount defaults it to None
+    account_doc = await asyncio.to_thread(
+        mongo_db["oauth_accounts"].find_one,
+        {"user_id": current_user.id, "provider": "gitlab"},
+        {"profile_json": 0},
     )
     oauth_account = OAuthAccount.from_document(account_doc)
     if oauth_account is None:
+        evict_gitlab_client(current_user.id)
         # Remove user session since no OAuth account exists
-        mongo_db["refresh_sessions"].delete_many({"user_id": current_user.id})
+        await asyncio.to_thread(
+            mongo_db["refresh_sessions"].delete_many, {"user_id": current_user.id}
+        )
 
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -98,18 +160,20 @@ async def get_gitlab_client(
 
     account_expires_at = ensure_utc(oauth_account.expires_at)
     if account_expires_at and account_expires_at <= _utcnow():
-        async with httpx.AsyncClient() as client:
-            try:
-                gitlab_oauth = GitlabAuthService()
-                token_response = await gitlab_oauth.refresh_token(
-                    client=client,
-                    refresh_token=oauth_account.refresh_token,
-                )
-            except Exception as exc:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Failed to refresh GitLab OAuth token",
-                ) from exc
+        # The cached client holds the expired token, whatever happens next
+        evict_gitlab_client(current_user.id)
+        client = get_http_client()
+        try:
+            gitlab_oauth = GitlabAuthService()
+            token_response = await gitlab_oauth.refresh_token(
+                client=client,
+                refresh_token=oauth_account.refresh_token,
+            )
+        except Exception as exc:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Failed to refresh GitLab OAuth token",
+            ) from exc
 
         expires_in = token_response.get("expires_in")
         update_doc: dict[str, object] = {
@@ -123,9 +187,11 @@ async def get_gitlab_client(
         }
         if expires_in:
             update_doc["expires_at"] = _utcnow() + dt.timedelta(seconds=expires_in)
+        account_expires_at = update_doc.get("expires_at")
 
         try:
-            mongo_db["oauth_accounts"].update_one(
+            await asyncio.to_thread(
+                mongo_db["oauth_accounts"].update_one,
                 {"id": oauth_account.id},
                 {"$set": update_doc},
             )
@@ -138,4 +204,9 @@ async def get_gitlab_client(
 
         oauth_account.access_token = update_doc["access_token"]
 
-    return gitlab.Gitlab(settings.gitlab.base, oauth_token=oauth_account.access_token)
+    gitlab_client = gitlab.Gitlab(
+        settings.gitlab.base, oauth_token=oauth_account.access_token
+    )
+    if account_expires_at is not None:
+        _gitlab_client_cache[current_user.id] = (gitlab_client, account_expires_at)
+    return gitlab_client
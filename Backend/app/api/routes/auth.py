@@ -2,14 +2,13 @@ import datetime as dt
 import json
 import uuid
 
-import httpx
 from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import RedirectResponse
 from pymongo.database import Database
 from pymongo.errors import DuplicateKeyError
 
-from app.api.deps import get_current_user
-from app.auth.gitlab import GitlabAuthService
+from app.api.deps import evict_auth_cache, evict_gitlab_client, get_current_user
+from app.auth.gitlab import GitlabAuthService, get_http_client
 from app.auth.jwt import create_access_token, create_jti, hash_token, new_refresh_token
 from app.core.config import settings
 from app.core.log import logger
@@ -65,6 +64,8 @@ async def refresh_token(
         except DuplicateKeyError:
             continue
 
+        # The access token minted for the old jti must stop working now
+        evict_auth_cache(user_session_doc["jti"])
         return RefreshTokenOut(
             access_token=access_token,
             refresh_token=new_rf_token,
@@ -82,7 +83,16 @@ async def logout(rf_in: RefreshTokenIn, mongo_db: Database = Depends(get_mongo_d
     Log out the currently authenticated user.
     """
     rf_token_hash = hash_token(rf_in.refresh_token)
-    mongo_db["refresh_sessions"].delete_many({"refresh_token_hash": rf_token_hash})
+    refresh_sessions = mongo_db["refresh_sessions"]
+    # Read the jtis before deleting; the cursor is lazy
+    session_docs = list(
+        refresh_sessions.find(
+            {"refresh_token_hash": rf_token_hash}, {"jti": 1, "_id": 0}
+        )
+    )
+    refresh_sessions.delete_many({"refresh_token_hash": rf_token_hash})
+    for session_doc in session_docs:
+        evict_auth_cache(session_doc["jti"])
     return {"detail": "Logged out successfully"}
 
 
@@ -156,19 +166,19 @@ async def gitlab_auth(code: str, state: str, mongo_db: Database = Depends(get_mo
 
     # Exchange code for token
     gitlab_oauth = GitlabAuthService()
-    async with httpx.AsyncClient() as client:
-        token_response = await gitlab_oauth.exchange_code_for_token(
-            client=client,
-            redirect_uri=redirect_uri,
-            code=code,
-            code_verifier=code_verifier,
-        )
+    client = get_http_client()
+    token_response = await gitlab_oauth.exchange_code_for_token(
+        client=client,
+        redirect_uri=redirect_uri,
+        code=code,
+        code_verifier=code_verifier,
+    )
 
-        # Get user info from GitLab
-        access_token = token_response["access_token"]
-        gitlab_user = await gitlab_oauth.get_userinfo(
-            client=client, access_token=access_token
-        )
+    # Get user info from GitLab
+    access_token = token_response["access_token"]
+    gitlab_user = await gitlab_oauth.get_userinfo(
+        client=client, access_token=access_token
+    )
 
     users_collection = mongo_db["users"]
     user = Users.from_document(
@@ -211,6 +221,8 @@ async def gitlab_auth(code: str, state: str, mongo_db: Database = Depends(get_mo
             {"id": oauth_account.id},
             {"$set": update_doc},
         )
+        # A client cached for this user still holds the replaced token
+        evict_gitlab_client(user.id)
     else:
         oauth_account = OAuthAccount(
             id=get_next_sequence("oauth_accounts"),
@@ -12,6 +12,10 @@ class MongoDBSettings(BaseModel):
     database: str = "gitlab_agent"
     root_username: str | None = None
     root_password: str | None = None
+    # The client is shared by every request and webhook; keep a few
+    # connections open so bursts don't pay the connection handshake
+    max_pool_size: int = 100
+    min_pool_size: int = 5
 
 
 class GitlabSettings(BaseModel):
@@ -67,7 +71,9 @@ class Settings(BaseSettings):
     default_llm_model: str = "openai/gpt-4o-mini"
     avatar_default_name: str = "default"
     max_tokens_per_diff: int = 4000
+    max_tokens_per_file: int = 8000
     max_tokens_per_context: int = 20000
+    llm_output_cache_ttl_seconds: int = 60 * 60
 
 
 settings = Settings()
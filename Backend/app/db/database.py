@@ -28,7 +28,13 @@ def get_client() -> MongoClient:
         else:
             uri = f"mongodb://{mongodb.host}:{mongodb.port}/{mongodb.database}"
 
-        _client = MongoClient(uri, tz_aware=True, tzinfo=dt.timezone.utc)
+        _client = MongoClient(
+            uri,
+            tz_aware=True,
+            tzinfo=dt.timezone.utc,
+            maxPoolSize=mongodb.max_pool_size,
+            minPoolSize=mongodb.min_pool_size,
+        )
     return _client
 
 
@@ -51,12 +57,19 @@ def init_db() -> None:
     """Create required indexes for the application collections."""
 
     db = get_mongo_database()
+    # Readable ids from get_next_sequence; auth and bot lookups query by them
+    db["users"].create_index("id", unique=True)
+    db["oauth_accounts"].create_index("id", unique=True)
+    db["bots"].create_index("id", unique=True)
     db["users"].create_index("email", unique=True)
     db["users"].create_index("username", unique=True, sparse=True)
     db["bots"].create_index("gitlab_project_path", unique=True)
     db["oauth_accounts"].create_index([("user_id", 1), ("provider", 1)], unique=True)
     db["refresh_sessions"].create_index("jti", unique=True)
     db["refresh_sessions"].create_index("expires_at", expireAfterSeconds=0, sparse=True)
+    db["mr_agent_history"].create_index(
+        [("project_id", 1), ("mr_id", 1), ("updated_at", -1)]
+    )
     db["cache"].create_index("key", unique=True)
     db["cache"].create_index(
         "expires_at",
@@ -123,7 +123,7 @@ class MrAgentHistory(MongoModel):
     output_tokens: int = 0
     cache_read_tokens: int = 0
     cache_write_tokens: int = 0
-    status: Literal["pending", "completed", "failed"] = "pending"
+    status: Literal["pending", "completed", "cache_hit", "failed"] = "pending"
     error_message: str | None = None
     updated_at: dt.datetime = field(
         default_factory=lambda: dt.datetime.now(dt.timezone.utc)
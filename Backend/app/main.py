@@ -11,6 +11,7 @@ from app.core.log import logger  # noqa: F401
 from app.schemas import GeneralErrorResponses
 from app.core.config import settings
 from app.db.database import init_db, close_client
+from app.auth.gitlab import close_http_client
 from app.api.main import api_router
 
 
@@ -20,8 +21,9 @@ async def lifespan(app: FastAPI):
     init_db()
     yield
 
-    # Shutdown: close the Mongo client
+    # Shutdown: close the Mongo and HTTP clients
     close_client()
+    await close_http_client()
 
 
 app = FastAPI(
@@ -1,6 +1,8 @@
-from jinja2 import Template
+from app.prompts.environment import compile_template
 
-system_template = Template("""You are MR-Doc, a language model that specializes in generating documentation for code components in a Merge Request (MR).
+system_template = compile_template(
+    "add_docs/system_template",
+    """You are MR-Doc, a language model that specializes in generating documentation for code components in a Merge Request (MR).
 Your task is to generate {{ docs_for_language }} for code components in the MR Diff.
 
 
@@ -75,10 +77,13 @@ Example output:
 }
 ```
 
-Return only JSON. Do not repeat the prompt, and do not include schema descriptions in the output.""")
+Return only JSON. Do not repeat the prompt, and do not include schema descriptions in the output.""",
+)
 
 
-user_template = Template("""MR Info:
+user_template = compile_template(
+    "add_docs/user_template",
+    """MR Info:
 
 Title: '{{ title }}'
 
@@ -105,4 +110,5 @@ The MR Diff:
 
 
 Response (should be valid JSON only):
-```json""")
+```json""",
+)
@@ -1,6 +1,8 @@
-from jinja2 import Template
+from app.prompts.environment import compile_template
 
-system_template = Template("""You are a MR-Reviewer, a language model designed to review a Gitlab Merge Request (MR).
+system_template = compile_template(
+    "describe/system_template",
+    """You are a MR-Reviewer, a language model designed to review a Gitlab Merge Request (MR).
 Your task is to provide a full description for the MR content: type, description, title, and files walkthrough.
 - Focus on the new MR code (lines starting with '+' in the 'MR Git Diff' section).
 - Keep in mind that the 'Previous title', 'Previous description' and 'Commit messages' sections may be partial, simplistic, non-informative or out of date. Hence, compare them to the MR diff code, and use them only as a reference.
@@ -72,10 +74,13 @@ Example output:
 }
 ```
 
-Answer should be valid JSON, and nothing else.""")
+Answer should be valid JSON, and nothing else.""",
+)
 
 
-user_template = Template("""{%- if related_issues %}
+user_template = compile_template(
+    "describe/user_template",
+    """{%- if related_issues %}
 Related issue Info:
 {% for issue in related_issues %}
 =====
@@ -149,4 +154,5 @@ Example output:
 
 
 Response (should be valid JSON, and nothing else):
-```json""")
+```json""",
+)
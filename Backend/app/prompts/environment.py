@@ -0,0 +1,19 @@
+"""Shared Jinja environment used to compile the prompt templates."""
+
+from jinja2 import Environment, FileSystemBytecodeCache, FunctionLoader, Template
+
+_template_sources: dict[str, str] = {}
+
+# Prompt sources live in code and never change while the process runs, so skip
+# the up-to-date checks and keep compiled bytecode on disk between restarts.
+prompt_env = Environment(
+    loader=FunctionLoader(_template_sources.get),
+    bytecode_cache=FileSystemBytecodeCache(),
+    auto_reload=False,
+)
+
+
+def compile_template(name: str, source: str) -> Template:
+    """Register a prompt template source under `name` and return it compiled."""
+    _template_sources[name] = source
+    return prompt_env.get_template(name)
@@ -1,6 +1,8 @@
-from jinja2 import Template
+from app.prompts.environment import compile_template
 
-system_template = Template("""You are MR-Reviewer, a language model designed to review a Gitlab Merge Request (MR).
+system_template = compile_template(
+    "review/system_template",
+    """You are MR-Reviewer, a language model designed to review a Gitlab Merge Request (MR).
 Your task is to provide constructive and concise feedback for the MR.
 The review should focus on new code added in the MR code diff (lines starting with '+')
 
@@ -141,9 +143,12 @@ Example output:
 }
 ```
 
-Answer should be valid JSON, and nothing else.""")
+Answer should be valid JSON, and nothing else.""",
+)
 
-user_template = Template("""{%- if related_issues %}
+user_template = compile_template(
+    "review/user_template",
+    """{%- if related_issues %}
 --MR Issue Info--
 {%- for issue in related_issues %}
 =====
@@ -236,4 +241,5 @@ Example output:
 
 
 Response (should be valid JSON, and nothing else):
-```json""")
+```json""",
+)
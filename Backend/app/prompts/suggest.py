@@ -1,6 +1,8 @@
-from jinja2 import Template
+from app.prompts.environment import compile_template
 
-system_template = Template("""You are MR-Reviewer, an AI specializing in Merge Request (MR) code analysis and suggestions.
+system_template = compile_template(
+    "suggest/system_template",
+    """You are MR-Reviewer, an AI specializing in Merge Request (MR) code analysis and suggestions.
 {%- if not focus_only_on_problems %}
 Your task is to examine the provided code diff, focusing on new code (lines prefixed with '+'), and offer concise, actionable suggestions to fix possible bugs and problems, and enhance code quality and performance.
 {%- else %}
@@ -117,9 +119,12 @@ Example output:
 }
 ```
 
-Return only valid JSON.""")
+Return only valid JSON.""",
+)
 
-user_template = Template("""--MR Info--
+user_template = compile_template(
+    "suggest/user_template",
+    """--MR Info--
 
 Title: '{{title}}'
 
@@ -157,9 +162,12 @@ Example output:
 
 
 Response (should be valid JSON only):
-```json""")
+```json""",
+)
 
-reflect_system_template = Template("""You are an AI language model specialized in reviewing and evaluating code suggestions for a Merge Request (MR).
+reflect_system_template = compile_template(
+    "suggest/reflect_system_template",
+    """You are an AI language model specialized in reviewing and evaluating code suggestions for a Merge Request (MR).
 Your task is to analyze a MR code diff and evaluate the correctness and importance set of AI-generated code suggestions.
 In addition to evaluating the suggestion correctness and importance, another sub-task you have is to detect the line numbers in the '__new hunk__' of the MR code diff section that correspond to the 'existing_code' snippet.
 
@@ -273,9 +281,12 @@ Example output:
 ```
 
 
-Return only valid JSON.""")
+Return only valid JSON.""",
+)
 
-reflect_user_template = Template("""You are given a Merge Request (MR) code diff:
+reflect_user_template = compile_template(
+    "suggest/reflect_user_template",
+    """You are given a Merge Request (MR) code diff:
 ======
 {{ diff|trim }}
 ======
@@ -310,4 +321,5 @@ Example output:
 
 Response (should be valid JSON only):
 ```json
-""")
+""",
+)
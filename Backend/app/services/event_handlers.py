@@ -1,3 +1,4 @@
+import asyncio
 from typing import Any, Dict
 
 import gitlab
@@ -89,6 +90,7 @@ async def handle_merge_request_event(
     wait_note = mr.notes.create({"body": "Analyzing the merge request..."})
 
     # Run the agent with the extracted information
+    response: str | None = None
     try:
         response = await smart_agent.run(
             mr_iid=mr_iid,
@@ -100,13 +102,17 @@ async def handle_merge_request_event(
         )
         response = f"Error processing the merge request: {str(e)}"
     finally:
-        # Remove the "Analyzing the merge request..." note
-        wait_note.delete()
-
-    # Create note as response
-    project = gitlab_client.projects.get(gitlab_project_id, lazy=True)
-    mr = project.mergerequests.get(mr_iid, lazy=True)
-    mr.notes.create({"body": response})
+        # Cancelled before any response existed; otherwise the note is removed
+        # below together with posting the response, exactly once
+        if response is None:
+            await asyncio.to_thread(wait_note.delete)
+
+    # Remove the "Analyzing the merge request..." note and post the response;
+    # the two GitLab calls are independent, so send them concurrently
+    await asyncio.gather(
+        asyncio.to_thread(wait_note.delete),
+        asyncio.to_thread(mr.notes.create, {"body": response}),
+    )
 
 
 async def handle_note_event(
@@ -159,6 +165,7 @@ async def handle_note_event(
     # Create a temporary "Processing..." note
     wait_note = discussion.notes.create({"body": "Processing your request..."})
 
+    reply: str | None = None
     try:
         if is_command:
             logger.info("Command detected in the note. Handling via CommandAgent.")
@@ -226,9 +233,14 @@ async def handle_note_event(
             f"Error generating reply for note event on MR {mr_iid} in project {project_id}"
         )
         reply = f"Error processing your request: {str(e)}"
-
     finally:
-        wait_note.delete()
-
-    # Post final reply
-    discussion.notes.create({"body": reply})
+        # Cancelled before any reply existed; otherwise the note is removed
+        # below together with posting the reply, exactly once
+        if reply is None:
+            await asyncio.to_thread(wait_note.delete)
+
+    # Remove the temporary note and post the final reply concurrently
+    await asyncio.gather(
+        asyncio.to_thread(wait_note.delete),
+        asyncio.to_thread(discussion.notes.create, {"body": reply}),
+    )